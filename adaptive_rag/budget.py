@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from typing_extensions import TypedDict
+
+from adaptive_rag.caches import is_cache_hit
+
+# Answer of a run whose budget ran out before anything was generated.
+BUDGET_EXHAUSTED_ANSWER = (
+    "I could not find an answer within the time and cost allowed for this question."
+)
+
+
+class BudgetReport(TypedDict):
+    """
+    What a run used of its budget.
+
+    Attributes:
+        llm_calls: chat model calls started
+        tokens: prompt and completion tokens reported by the model, not
+            counting responses served by the response cache
+        elapsed: seconds since the run started
+        exhausted_by: "llm_calls", "tokens" or "deadline", None if within budget
+    """
+
+    llm_calls: int
+    tokens: int
+    elapsed: float
+    exhausted_by: Optional[str]
+
+
+class RunBudget(BaseCallbackHandler):
+    """
+    Limits on the LLM calls, tokens and wall time of one graph run.
+
+    Pass it in the graph input under "budget" and as a callback of the run, as
+    get_answer_for(..., budget=RunBudget(...)) does. As a callback it counts
+    every model call of the nodes and of the graders in the edges; the edges
+    check it and leave the loop through the fallback node once it is spent.
+    A run in progress finishes its current step, so usage can overshoot a
+    limit by one step. The deadline runs from the start of the graph run.
+
+    A budget can be reused for runs one after the other: the start of a new
+    graph run resets its counts and deadline. Concurrent runs need a budget
+    each, see get_answers_for(..., budget_factory=RunBudget).
+    """
+
+    # Count on the calling thread, so that the edges see every finished call.
+    run_inline = True
+
+    def __init__(
+        self,
+        max_llm_calls: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+    ):
+        self.max_llm_calls = max_llm_calls
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.llm_calls = 0
+        self.tokens = 0
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def on_chain_start(
+        self,
+        serialized,
+        inputs,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        if parent_run_id is None:
+            with self._lock:
+                self.llm_calls = 0
+                self.tokens = 0
+                self.started_at = time.monotonic()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any):
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs: Any):
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        if is_cache_hit(response):
+            # A cached response costs nothing, as in GraphTracer.
+            return
+        tokens = total_tokens(response)
+        with self._lock:
+            self.tokens += tokens
+
+    def exhausted_by(self) -> Optional[str]:
+        """The first limit reached, or None while the run is within budget."""
+        with self._lock:
+            if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+                return "llm_calls"
+            if self.max_tokens is not None and self.tokens >= self.max_tokens:
+                return "tokens"
+        if self.max_seconds is not None and self.elapsed() >= self.max_seconds:
+            return "deadline"
+        return None
+
+    def exhausted(self) -> bool:
+        return self.exhausted_by() is not None
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return time.monotonic() - self.started_at
+
+    def report(self) -> BudgetReport:
+        exhausted_by = self.exhausted_by()
+        with self._lock:
+            return BudgetReport(
+                llm_calls=self.llm_calls,
+                tokens=self.tokens,
+                elapsed=self.elapsed(),
+                exhausted_by=exhausted_by,
+            )
+
+
+def total_tokens(response: LLMResult) -> int:
+    """Tokens used by a model response, from its usage metadata or token usage."""
+    tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                tokens += usage.get("total_tokens", 0)
+    if tokens:
+        return tokens
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens", 0)
@@ -0,0 +1,555 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Protocol, Sequence
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation, LLMResult
+from typing_extensions import TypedDict
+
+# Set in the generation_info of responses served by a ResponseCache.
+CACHE_HIT_KEY = "cache_hit"
+
+
+class SemanticCacheEntry(TypedDict):
+    """
+    A cached answer.
+
+    Attributes:
+        key: hash of the question that produced the answer
+        question: question that produced the answer
+        embedding: normalized float32 embedding of the question
+        generation: final LLM generation
+        documents: source documents of the generation
+        created_at: creation time, seconds since the epoch
+        last_access: last hit or creation time, seconds since the epoch
+    """
+
+    key: str
+    question: str
+    embedding: np.ndarray
+    generation: str
+    documents: List[Document]
+    created_at: float
+    last_access: float
+
+
+class SemanticCacheKey(TypedDict):
+    """
+    What a SemanticCache keeps in memory about an entry to match and expire it.
+
+    Attributes:
+        key: hash of the question that produced the answer
+        embedding: normalized float32 embedding of the question
+        created_at: creation time, seconds since the epoch
+        last_access: last hit or creation time, seconds since the epoch
+    """
+
+    key: str
+    embedding: np.ndarray
+    created_at: float
+    last_access: float
+
+
+class SemanticCacheStore(Protocol):
+    def __len__(self) -> int: ...
+
+    def keys(self) -> Iterator[SemanticCacheKey]:
+        """Yield the keys of all entries from least to most recently used."""
+        ...
+
+    def get(self, key: str) -> Optional[SemanticCacheEntry]: ...
+
+    def put(self, entry: SemanticCacheEntry) -> None: ...
+
+    def touch(self, key: str, last_access: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def expire(self, created_before: float) -> None:
+        """Delete every entry created before the given time."""
+        ...
+
+
+class InMemorySemanticStore:
+    def __init__(self):
+        self._entries: Dict[str, SemanticCacheEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> Iterator[SemanticCacheKey]:
+        for entry in sorted(self._entries.values(), key=lambda e: e["last_access"]):
+            yield _key_of(entry)
+
+    def get(self, key: str) -> Optional[SemanticCacheEntry]:
+        return self._entries.get(key)
+
+    def put(self, entry: SemanticCacheEntry) -> None:
+        self._entries[entry["key"]] = entry
+
+    def touch(self, key: str, last_access: float) -> None:
+        if key in self._entries:
+            self._entries[key]["last_access"] = last_access
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def expire(self, created_before: float) -> None:
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if entry["created_at"] < created_before
+        ]:
+            del self._entries[key]
+
+
+class SQLiteSemanticStore:
+    """Keeps cached answers in a local SQLite file so they survive restarts."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS semantic_cache (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                generation TEXT NOT NULL,
+                documents TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS semantic_cache_created_at"
+            " ON semantic_cache (created_at)"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM semantic_cache").fetchone()
+        return count
+
+    def keys(self) -> Iterator[SemanticCacheKey]:
+        # Only the columns needed for matching; answers and documents stay on disk.
+        rows = self._conn.execute(
+            "SELECT key, embedding, created_at, last_access FROM semantic_cache"
+            " ORDER BY last_access"
+        ).fetchall()
+        for key, embedding, created_at, last_access in rows:
+            yield SemanticCacheKey(
+                key=key,
+                embedding=np.frombuffer(embedding, dtype=np.float32),
+                created_at=created_at,
+                last_access=last_access,
+            )
+
+    def get(self, key: str) -> Optional[SemanticCacheEntry]:
+        row = self._conn.execute(
+            "SELECT question, embedding, generation, documents, created_at,"
+            " last_access FROM semantic_cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        question, embedding, generation, documents, created_at, last_access = row
+        return SemanticCacheEntry(
+            key=key,
+            question=question,
+            embedding=np.frombuffer(embedding, dtype=np.float32),
+            generation=generation,
+            documents=[Document(**document) for document in json.loads(documents)],
+            created_at=created_at,
+            last_access=last_access,
+        )
+
+    def put(self, entry: SemanticCacheEntry) -> None:
+        documents = [
+            {"page_content": document.page_content, "metadata": document.metadata}
+            for document in entry["documents"]
+        ]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry["key"],
+                entry["question"],
+                np.asarray(entry["embedding"], dtype=np.float32).tobytes(),
+                entry["generation"],
+                json.dumps(documents, default=str),
+                entry["created_at"],
+                entry["last_access"],
+            ),
+        )
+        self._conn.commit()
+
+    def touch(self, key: str, last_access: float) -> None:
+        self._conn.execute(
+            "UPDATE semantic_cache SET last_access = ? WHERE key = ?",
+            (last_access, key),
+        )
+        self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM semantic_cache WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def expire(self, created_before: float) -> None:
+        self._conn.execute(
+            "DELETE FROM semantic_cache WHERE created_at < ?", (created_before,)
+        )
+        self._conn.commit()
+
+
+def _key_of(entry: SemanticCacheEntry) -> SemanticCacheKey:
+    return SemanticCacheKey(
+        key=entry["key"],
+        embedding=entry["embedding"],
+        created_at=entry["created_at"],
+        last_access=entry["last_access"],
+    )
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on question embeddings.
+
+    A lookup hits when a cached question is at least `threshold` cosine-similar
+    to the new one. Entries expire after `ttl` seconds, and the least recently
+    used entry is evicted once the cache holds `max_size` entries.
+
+    The keys, embeddings and timestamps of the entries are loaded from the
+    store once and then kept in memory; the store is only read for the answer
+    of a hit. A store should therefore not be shared by several live caches.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        store: Optional[SemanticCacheStore] = None,
+        threshold: float = 0.95,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+    ):
+        if embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+
+            embeddings = OpenAIEmbeddings()
+        self.embeddings = embeddings
+        self.store = store if store is not None else InMemorySemanticStore()
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        # From least to most recently used.
+        self._keys: "OrderedDict[str, SemanticCacheKey]" = OrderedDict(
+            (key["key"], key) for key in self.store.keys()
+        )
+        self._index_keys: List[str] = []
+        self._index: Optional[np.ndarray] = None
+
+    def lookup(self, question: str) -> Optional[SemanticCacheEntry]:
+        """
+        Find a cached answer for a question similar enough to this one.
+
+        Args:
+            question (str): The user question
+
+        Returns:
+            SemanticCacheEntry: The best matching entry, or None on a miss
+        """
+        embedding = self._embed(question)
+        with self._lock:
+            self._expire(time.time())
+            if self._keys:
+                keys, index = self._get_index()
+                similarities = index @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry = self.store.get(keys[best])
+                    if entry is not None:
+                        entry["last_access"] = time.time()
+                        self.store.touch(entry["key"], entry["last_access"])
+                        self._keys[entry["key"]]["last_access"] = entry["last_access"]
+                        self._keys.move_to_end(entry["key"])
+                        self.hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def add(self, question: str, generation: str, documents: List[Document]):
+        """
+        Cache the final answer to a question.
+
+        Args:
+            question (str): The user question
+            generation (str): The final LLM generation
+            documents (list): Source documents of the generation
+        """
+        key = hashlib.sha256(question.encode("utf-8")).hexdigest()
+        embedding = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._keys.pop(key, None)
+            while self._keys and len(self._keys) >= self.max_size:
+                evicted, _ = self._keys.popitem(last=False)
+                self.store.delete(evicted)
+                self.evictions += 1
+            entry = SemanticCacheEntry(
+                key=key,
+                question=question,
+                embedding=embedding,
+                generation=generation,
+                documents=list(documents),
+                created_at=now,
+                last_access=now,
+            )
+            self.store.put(entry)
+            self._keys[key] = _key_of(entry)
+            self._index = None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hit_rate,
+            "size": len(self._keys),
+        }
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        created_before = now - self.ttl
+        expired = [
+            key
+            for key, value in self._keys.items()
+            if value["created_at"] < created_before
+        ]
+        if not expired:
+            return
+        self.store.expire(created_before)
+        for key in expired:
+            del self._keys[key]
+        self.expirations += len(expired)
+        self._index = None
+
+    def _get_index(self):
+        # Touching entries reorders them but does not change the index, so it is
+        # only rebuilt when the set of cached questions changes.
+        if self._index is None:
+            self._index_keys = list(self._keys)
+            self._index = np.stack(
+                [self._keys[key]["embedding"] for key in self._index_keys]
+            )
+        return self._index_keys, self._index
+
+
+class ResponseCache(BaseCache):
+    """
+    Exact-match cache for LLM responses.
+
+    Keys hash the LLM string, which carries the model name, its parameters and
+    any bound tools or structured-output schema, together with the rendered
+    prompt messages. Entries live in an in-memory LRU tier and, when a SQLite
+    path is given, in a disk tier shared by every cache using that path.
+    """
+
+    def __init__(
+        self, name: str, max_size: int = 4096, sqlite_path: Optional[str] = None
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Sequence[Generation]]" = OrderedDict()
+        self._disk = _get_response_disk_tier(sqlite_path) if sqlite_path else None
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = _response_key(prompt, llm_string)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return _mark_cache_hit(self._memory[key])
+        value = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, value)
+            return _mark_cache_hit(value)
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        key = _response_key(prompt, llm_string)
+        with self._lock:
+            self._remember(key, return_val)
+        if self._disk is not None:
+            self._disk.put(key, return_val)
+
+    def clear(self, **kwargs) -> None:
+        """
+        Drop every entry, from memory and from disk.
+
+        The disk tier is shared by every cache using the same path, so their
+        persisted entries are dropped too.
+        """
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._memory),
+        }
+
+    def _remember(self, key: str, value: Sequence[Generation]):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+
+class _ResponseDiskTier:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache"
+            " (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Sequence[Generation]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def put(self, key: str, value: Sequence[Generation]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?)",
+                (key, dumps(list(value))),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+
+def _mark_cache_hit(generations: Sequence[Generation]) -> List[Generation]:
+    return [
+        generation.model_copy(
+            update={
+                "generation_info": {
+                    **(generation.generation_info or {}),
+                    CACHE_HIT_KEY: True,
+                }
+            }
+        )
+        for generation in generations
+    ]
+
+
+def is_cache_hit(response: LLMResult) -> bool:
+    """Whether a model response was served by a ResponseCache."""
+    return any(
+        (generation.generation_info or {}).get(CACHE_HIT_KEY)
+        for generations in response.generations
+        for generation in generations
+    )
+
+
+def _response_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+_response_caches: Dict[str, ResponseCache] = {}
+_response_disk_tiers: Dict[str, _ResponseDiskTier] = {}
+# Re-entrant because building a cache also looks up its disk tier.
+_response_caches_lock = threading.RLock()
+
+
+def _get_response_disk_tier(path: str) -> _ResponseDiskTier:
+    with _response_caches_lock:
+        if path not in _response_disk_tiers:
+            _response_disk_tiers[path] = _ResponseDiskTier(path)
+        return _response_disk_tiers[path]
+
+
+def response_cache_enabled() -> bool:
+    """
+    Whether chains cache their responses.
+
+    On by default; set the ADAPTIVE_RAG_RESPONSE_CACHE environment variable to
+    "0" or "false" to call the model every time, e.g. when benchmarking.
+    """
+    return os.getenv("ADAPTIVE_RAG_RESPONSE_CACHE", "1").lower() not in ["0", "false"]
+
+
+def get_response_cache(name: str) -> ResponseCache:
+    """
+    The process-wide response cache of a chain.
+
+    The disk tier is enabled by the ADAPTIVE_RAG_RESPONSE_CACHE_PATH environment
+    variable, and is shared by all chains.
+
+    Args:
+        name (str): Name of the chain the cache belongs to
+
+    Returns:
+        ResponseCache: The cache of that chain
+    """
+    with _response_caches_lock:
+        if name not in _response_caches:
+            _response_caches[name] = ResponseCache(
+                name, sqlite_path=os.getenv("ADAPTIVE_RAG_RESPONSE_CACHE_PATH")
+            )
+        return _response_caches[name]
+
+
+def get_response_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit and miss counters of every chain's response cache."""
+    with _response_caches_lock:
+        caches = list(_response_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
@@ -0,0 +1,96 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
+
+from adaptive_rag.models import (
+    get_corpus_vectorstore,
+    get_retriever,
+    get_rag_chain,
+    get_retrieval_grader,
+    get_batch_retrieval_grader,
+    get_question_rewriter,
+    get_web_search_tool,
+    get_question_router,
+    get_hallucination_grader,
+    get_answer_grader,
+)
+from adaptive_rag.packing import get_encoding
+from adaptive_rag.routers import SimilarityPreRouter
+from common.embeddings import get_cached_embeddings
+
+
+class RagComponents:
+    """
+    Retriever, chains and tools used by the adaptive RAG nodes and edges.
+
+    Components passed to the constructor are used as given, which lets tests and
+    benchmarks swap in local stand-ins. Everything else is built on first access
+    with the factories in adaptive_rag.models and then reused. Factories get the
+    components object, so a component can be built from the others.
+    """
+
+    factories: Dict[str, Callable[["RagComponents"], Any]] = {
+        "embeddings": lambda components: get_cached_embeddings(),
+        "vectorstore": lambda components: get_corpus_vectorstore(),
+        "retriever": lambda components: get_retriever(components.vectorstore),
+        "rag_chain": lambda components: get_rag_chain(),
+        "retrieval_grader": lambda components: get_retrieval_grader(),
+        "batch_retrieval_grader": lambda components: get_batch_retrieval_grader(),
+        "question_rewriter": lambda components: get_question_rewriter(),
+        "web_search_tool": lambda components: get_web_search_tool(),
+        "question_router": lambda components: get_question_router(),
+        "pre_router": lambda components: SimilarityPreRouter(components.vectorstore),
+        "hallucination_grader": lambda components: get_hallucination_grader(),
+        "answer_grader": lambda components: get_answer_grader(),
+        "token_encoding": lambda components: get_encoding(),
+    }
+
+    def __init__(self, **components: Any):
+        unknown = set(components) - set(self.factories)
+        if unknown:
+            raise TypeError(f"Unknown components: {', '.join(sorted(unknown))}")
+        self._components = dict(components)
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name not in self.factories:
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = self.factories[name](self)
+            return self._components[name]
+
+
+_default_components: Optional[RagComponents] = None
+_default_lock = threading.Lock()
+
+
+def get_default_components() -> RagComponents:
+    """Process-wide components, created on first use after loading .env."""
+    global _default_components
+    with _default_lock:
+        if _default_components is None:
+            load_dotenv()
+            _default_components = RagComponents()
+        return _default_components
+
+
+def get_components(config: Optional[RunnableConfig] = None) -> RagComponents:
+    """
+    Components injected through the run config, or the process-wide default.
+
+    Args:
+        config (RunnableConfig): The config of the current graph run
+
+    Returns:
+        RagComponents: Components to use for this run
+    """
+    components = get_setting(config, "components")
+    return components if components is not None else get_default_components()
+
+
+def get_setting(config: Optional[RunnableConfig], key: str, default: Any = None):
+    """Read a key from the configurable section of a run config."""
+    return ((config or {}).get("configurable") or {}).get(key, default)
@@ -1,40 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from typing import Literal
 
-from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
 
-from adaptive_rag.models import (
-    get_question_router,
-    get_hallucination_grader,
-    get_answer_grader,
-)
+from adaptive_rag.components import RagComponents, get_components, get_setting
 from adaptive_rag.states import GraphState
 
-load_dotenv()
 
-question_router = get_question_router()
-hallucination_grader = get_hallucination_grader()
-answer_grader = get_answer_grader()
-
-
-def route_question(state: GraphState) -> Literal["vectorstore", "web_search"]:
+def route_question(
+    state: GraphState, config: RunnableConfig
+) -> Literal["vectorstore", "web_search"]:
     """
     Route question to web search or RAG.
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
         str: Next node to call
     """
     question = state["question"]
-    source = question_router.invoke({"question": question})
-    if source.datasource == "web_search":
-        return "web_search"
-    elif source.datasource == "vectorstore":
-        return "vectorstore"
+    components = get_components(config)
+
+    def route_with_llm(question: str) -> Literal["vectorstore", "web_search"]:
+        source = components.question_router.invoke({"question": question})
+        if source.datasource == "web_search":
+            return "web_search"
+        elif source.datasource == "vectorstore":
+            return "vectorstore"
+
+    thresholds = get_setting(config, "pre_routing_thresholds")
+    if thresholds:
+        return components.pre_router.route(question, route_with_llm, thresholds)
+    return route_with_llm(question)
+
+
+async def aroute_question(
+    state: GraphState, config: RunnableConfig
+) -> Literal["vectorstore", "web_search"]:
+    """Async version of route_question."""
+    question = state["question"]
+    components = get_components(config)
+
+    async def route_with_llm(question: str) -> Literal["vectorstore", "web_search"]:
+        source = await components.question_router.ainvoke({"question": question})
+        if source.datasource == "web_search":
+            return "web_search"
+        elif source.datasource == "vectorstore":
+            return "vectorstore"
 
+    thresholds = get_setting(config, "pre_routing_thresholds")
+    if thresholds:
+        return await components.pre_router.aroute(question, route_with_llm, thresholds)
+    return await route_with_llm(question)
 
-def decide_to_generate(state: GraphState) -> Literal["transform_query", "generate"]:
+
+def decide_to_generate(
+    state: GraphState,
+) -> Literal["transform_query", "generate", "budget exhausted"]:
     """
     Determines whether to generate an answer, or re-generate a question.
 
@@ -46,6 +72,8 @@ def decide_to_generate(state: GraphState) -> Literal["transform_query", "generat
     """
     filtered_documents = state["documents"]
 
+    if _budget_exhausted(state):
+        return "budget exhausted"
     if not filtered_documents:
         # All documents have been filtered check_relevance
         # We will re-generate a new query
@@ -56,29 +84,42 @@ def decide_to_generate(state: GraphState) -> Literal["transform_query", "generat
 
 
 def grade_generation_v_documents_and_question(
-    state: GraphState,
-) -> Literal["useful", "not useful", "not supported"]:
+    state: GraphState, config: RunnableConfig
+) -> Literal["useful", "not useful", "not supported", "budget exhausted"]:
     """
     Determines whether the generation is grounded in the document and answers question.
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
-        str: Decision for next node to call
+        str: Decision for next node to call, "budget exhausted" once the run
+            budget is spent
     """
     question = state["question"]
     documents = state["documents"]
     generation = state["generation"]
+    components = get_components(config)
+
+    if _budget_exhausted(state):
+        # Skip grading; the fallback answers with this generation.
+        return "budget exhausted"
+    if get_setting(config, "speculative_grading", False):
+        return _grade_generation_speculatively(
+            components, question, documents, generation
+        )
 
-    score = hallucination_grader.invoke(
+    score = components.hallucination_grader.invoke(
         {"documents": documents, "generation": generation}
     )
     grade = score.binary_score
 
     # Check hallucination
     if grade == "yes":
-        score = answer_grader.invoke({"question": question, "generation": generation})
+        score = components.answer_grader.invoke(
+            {"question": question, "generation": generation}
+        )
         grade = score.binary_score
         if grade == "yes":
             return "useful"
@@ -86,3 +127,91 @@ def grade_generation_v_documents_and_question(
             return "not useful"
     else:
         return "not supported"
+
+
+async def agrade_generation_v_documents_and_question(
+    state: GraphState, config: RunnableConfig
+) -> Literal["useful", "not useful", "not supported", "budget exhausted"]:
+    """Async version of grade_generation_v_documents_and_question."""
+    question = state["question"]
+    documents = state["documents"]
+    generation = state["generation"]
+    components = get_components(config)
+
+    if _budget_exhausted(state):
+        # Skip grading; the fallback answers with this generation.
+        return "budget exhausted"
+    if get_setting(config, "speculative_grading", False):
+        return await _agrade_generation_speculatively(
+            components, question, documents, generation
+        )
+
+    score = await components.hallucination_grader.ainvoke(
+        {"documents": documents, "generation": generation}
+    )
+    if score.binary_score != "yes":
+        return "not supported"
+    score = await components.answer_grader.ainvoke(
+        {"question": question, "generation": generation}
+    )
+    if score.binary_score == "yes":
+        return "useful"
+    else:
+        return "not useful"
+
+
+def _grade_generation_speculatively(
+    components: RagComponents, question, documents, generation
+) -> Literal["useful", "not useful", "not supported"]:
+    # Start the answer grader alongside the hallucination grader, betting on a
+    # grounded generation. Same decision table as the sequential path.
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        hallucination_future = executor.submit(
+            copy_context().run,
+            components.hallucination_grader.invoke,
+            {"documents": documents, "generation": generation},
+        )
+        answer_future = executor.submit(
+            copy_context().run,
+            components.answer_grader.invoke,
+            {"question": question, "generation": generation},
+        )
+
+        if hallucination_future.result().binary_score != "yes":
+            answer_future.cancel()
+            return "not supported"
+        if answer_future.result().binary_score == "yes":
+            return "useful"
+        else:
+            return "not useful"
+    finally:
+        # Don't wait for an answer grade that is no longer needed.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _agrade_generation_speculatively(
+    components: RagComponents, question, documents, generation
+) -> Literal["useful", "not useful", "not supported"]:
+    answer_task = asyncio.ensure_future(
+        components.answer_grader.ainvoke(
+            {"question": question, "generation": generation}
+        )
+    )
+    try:
+        score = await components.hallucination_grader.ainvoke(
+            {"documents": documents, "generation": generation}
+        )
+        if score.binary_score != "yes":
+            return "not supported"
+        if (await answer_task).binary_score == "yes":
+            return "useful"
+        else:
+            return "not useful"
+    finally:
+        answer_task.cancel()
+
+
+def _budget_exhausted(state: GraphState) -> bool:
+    budget = state.get("budget")
+    return budget is not None and budget.exhausted()
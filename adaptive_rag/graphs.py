@@ -1,32 +1,86 @@
+from typing import Optional
+
+from langchain_core.runnables import RunnableLambda
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
+from langgraph.graph.state import CompiledStateGraph
 
+from adaptive_rag.components import RagComponents
 from adaptive_rag.edges import (
     route_question,
+    aroute_question,
     decide_to_generate,
     grade_generation_v_documents_and_question,
+    agrade_generation_v_documents_and_question,
 )
 from adaptive_rag.nodes import (
     web_search,
+    aweb_search,
     retrieve,
+    aretrieve,
     grade_documents,
+    agrade_documents,
     generate,
+    agenerate,
     transform_query,
+    atransform_query,
+    fallback,
 )
 from adaptive_rag.states import GraphState
 
 
-def get_adaptive_rag_graph():
+def get_adaptive_rag_graph(
+    components: Optional[RagComponents] = None, **settings
+) -> CompiledStateGraph:
+    """
+    Build the adaptive RAG graph.
+
+    Compiling the graph does not build any retriever, chain or tool. They are
+    created on first use, from the given components or the process-wide default.
+    Every node and edge has an async version, used by ainvoke and astream.
+    A RunBudget given in the input under "budget" bounds the loops: once it is
+    spent the graph ends through the fallback node with the latest generation.
+
+    Args:
+        components (RagComponents): Components to run the graph with
+        **settings: Defaults for the configurable run settings, which can also
+            be passed per run under config["configurable"]:
+            grading_mode (str): "per_document" (default) grades each document
+                in its own call, "single_call" grades all of them in one call
+            grading_max_concurrency (int): Limit on concurrent document grades
+            speculative_grading (bool): Run the hallucination and answer
+                graders concurrently instead of one after the other
+            pre_routing_thresholds (tuple): (lower, upper) cosine similarity
+                bounds; questions whose closest chunk is above upper go to the
+                vectorstore and below lower to web search without calling the
+                LLM router, see SimilarityPreRouter.calibrate
+            grading_score_thresholds (tuple): (lower, upper) cosine similarity
+                bounds; retrieved documents above upper are accepted and below
+                lower rejected without calling the LLM grader
+            context_token_budget (int): Tokens of document content passed to
+                the generation prompt after near-duplicate chunks are dropped,
+                3000 by default
+
+    Returns:
+        CompiledStateGraph: The compiled graph
+    """
     workflow = StateGraph(GraphState)
 
-    workflow.add_node("web_search", web_search)
-    workflow.add_node("retrieve", retrieve)
-    workflow.add_node("grade_documents", grade_documents)
-    workflow.add_node("generate", generate)
-    workflow.add_node("transform_query", transform_query)
+    workflow.add_node("web_search", _sync_and_async(web_search, aweb_search))
+    workflow.add_node("retrieve", _sync_and_async(retrieve, aretrieve))
+    workflow.add_node(
+        "grade_documents", _sync_and_async(grade_documents, agrade_documents)
+    )
+    workflow.add_node("generate", _sync_and_async(generate, agenerate))
+    workflow.add_node(
+        "transform_query", _sync_and_async(transform_query, atransform_query)
+    )
+    workflow.add_node("fallback", fallback)
 
     workflow.add_conditional_edges(
-        START, route_question, {"web_search": "web_search", "vectorstore": "retrieve"}
+        START,
+        _sync_and_async(route_question, aroute_question),
+        {"web_search": "web_search", "vectorstore": "retrieve"},
     )
     workflow.add_edge("web_search", "generate")
     workflow.add_edge("retrieve", "grade_documents")
@@ -36,17 +90,34 @@ def get_adaptive_rag_graph():
         {
             "transform_query": "transform_query",
             "generate": "generate",
+            "budget exhausted": "fallback",
         },
     )
     workflow.add_edge("transform_query", "retrieve")
     workflow.add_conditional_edges(
         "generate",
-        grade_generation_v_documents_and_question,
+        _sync_and_async(
+            grade_generation_v_documents_and_question,
+            agrade_generation_v_documents_and_question,
+        ),
         {
             "not supported": "generate",
             "useful": END,
             "not useful": "transform_query",
+            "budget exhausted": "fallback",
         },
     )
+    workflow.add_edge("fallback", END)
+
+    graph = workflow.compile()
+    if components is not None:
+        settings["components"] = components
+    if settings:
+        # Pregel.with_config returns a copy of the compiled graph rather than
+        # a RunnableBinding, so get_graph, get_state etc. remain available.
+        graph = graph.with_config(configurable=settings)
+    return graph
+
 
-    return workflow.compile()
+def _sync_and_async(func, afunc) -> RunnableLambda:
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.vectorstores import VectorStore
+from langchain_text_splitters import TextSplitter
+from typing_extensions import TypedDict
+
+from adaptive_rag.vectorstores import NumpyVectorStore
+from common.concurrency import run_sync
+from common.loaders import AsyncWebFetcher, FetchResult, html_to_document
+
+
+class SourceRecord(TypedDict):
+    """
+    What the index knows about one source.
+
+    Attributes:
+        etag: ETag header of the last fetched version
+        last_modified: Last-Modified header of the last fetched version
+        content_hash: SHA-256 of the extracted text of the last fetched version
+        chunk_ids: ids of the chunks of that version in the vector store
+        checked_at: Unix time the source was last fetched successfully
+    """
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    chunk_ids: List[str]
+    checked_at: float
+
+
+class IngestionReport(TypedDict):
+    """
+    Outcome of a refresh, as lists of source URLs.
+
+    Attributes:
+        added: sources that were not indexed before
+        updated: sources whose content changed and were re-indexed
+        deleted: sources that are no longer part of the corpus
+        unchanged: sources left as they were
+        failed: sources that could not be fetched, whose chunks are kept as
+            they were
+        errors: why each failed source could not be fetched
+    """
+
+    added: List[str]
+    updated: List[str]
+    deleted: List[str]
+    unchanged: List[str]
+    failed: List[str]
+    errors: Dict[str, str]
+
+
+class CorpusIngestor:
+    """
+    Keeps a vector store in sync with a list of web sources.
+
+    Each source is fetched with conditional request headers, and its extracted
+    text is hashed. Only sources that are new, changed or gone get their chunks
+    added, replaced or deleted, so a refresh costs in proportion to the churn
+    rather than the corpus size. The per-source state is kept in a JSON
+    manifest next to the index.
+    """
+
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        text_splitter: TextSplitter,
+        manifest_path: Optional[str] = None,
+        fetcher: Optional[AsyncWebFetcher] = None,
+    ):
+        self.vectorstore = vectorstore
+        self.text_splitter = text_splitter
+        self.manifest_path = manifest_path
+        self.manifest: Dict[str, SourceRecord] = self._load_manifest()
+        self.fetcher = fetcher or AsyncWebFetcher()
+
+    def sources(self) -> List[str]:
+        return list(self.manifest)
+
+    def checked_at(self) -> Optional[float]:
+        """
+        When the least recently checked source was last fetched.
+
+        Returns:
+            float: Unix time, 0 for manifests written before it was recorded,
+                None when no source is indexed
+        """
+        if not self.manifest:
+            return None
+        return min(record.get("checked_at", 0.0) for record in self.manifest.values())
+
+    def refresh(self, urls: List[str]) -> IngestionReport:
+        """
+        Bring the vector store up to date with the given sources.
+
+        Args:
+            urls (list): Source URLs making up the corpus
+
+        Returns:
+            IngestionReport: What happened to each source
+        """
+        return run_sync(self.arefresh(urls))
+
+    async def arefresh(self, urls: List[str]) -> IngestionReport:
+        """
+        Bring the vector store up to date with the given sources.
+
+        Sources are fetched concurrently and each one is ingested as soon as it
+        arrives, while the remaining fetches continue. The vector store and the
+        manifest are persisted once, when the refresh ends.
+
+        Args:
+            urls (list): Source URLs making up the corpus
+
+        Returns:
+            IngestionReport: What happened to each source
+        """
+        report = IngestionReport(
+            added=[], updated=[], deleted=[], unchanged=[], failed=[], errors={}
+        )
+
+        try:
+            for url in [url for url in self.manifest if url not in urls]:
+                self._delete_chunks(self.manifest.pop(url)["chunk_ids"])
+                report["deleted"].append(url)
+
+            requests = [(url, self._conditional_headers(url)) for url in urls]
+            async for fetched in self.fetcher.afetch_all(requests):
+                await asyncio.to_thread(self.ingest, fetched, report)
+        finally:
+            # Store first: the manifest must never list chunks the store lacks.
+            await asyncio.to_thread(self.persist)
+        return report
+
+    def persist(self):
+        """Write the vector store and the manifest to disk."""
+        if isinstance(self.vectorstore, NumpyVectorStore):
+            self.vectorstore.persist()
+        self._save_manifest()
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        headers = {}
+        record = self.manifest.get(url)
+        if record is not None:
+            if record["etag"]:
+                headers["If-None-Match"] = record["etag"]
+            if record["last_modified"]:
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def ingest(self, fetched: FetchResult, report: IngestionReport):
+        """
+        Update the chunks of one fetched source, in memory until persist().
+
+        Args:
+            fetched (FetchResult): The fetched source
+            report (IngestionReport): Report to record the outcome in
+        """
+        url = fetched["url"]
+        if fetched["error"] is not None:
+            report["failed"].append(url)
+            report["errors"][url] = fetched["error"]
+            return
+
+        record = self.manifest.get(url)
+        if record is not None and fetched["status"] == 304:
+            record["checked_at"] = time.time()
+            report["unchanged"].append(url)
+            return
+
+        document = html_to_document(url, fetched["text"])
+        content_hash = hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+        if record is not None and record["content_hash"] == content_hash:
+            # Same text under new validators, e.g. a server that doesn't send
+            # stable ETags. Only the validators need updating.
+            record["etag"] = fetched["etag"]
+            record["last_modified"] = fetched["last_modified"]
+            record["checked_at"] = time.time()
+            report["unchanged"].append(url)
+            return
+
+        chunks = self.text_splitter.split_documents([document])
+        source_id = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        chunk_ids = [f"{source_id}-{index}" for index in range(len(chunks))]
+
+        if record is not None:
+            stale_ids = set(record["chunk_ids"]) - set(chunk_ids)
+            self._delete_chunks(list(stale_ids))
+        if chunks:
+            self.vectorstore.add_documents(chunks, ids=chunk_ids)
+
+        self.manifest[url] = SourceRecord(
+            etag=fetched["etag"],
+            last_modified=fetched["last_modified"],
+            content_hash=content_hash,
+            chunk_ids=chunk_ids,
+            checked_at=time.time(),
+        )
+        report["added" if record is None else "updated"].append(url)
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        if chunk_ids:
+            self.vectorstore.delete(ids=chunk_ids)
+
+    def _load_manifest(self) -> Dict[str, SourceRecord]:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        if not self.manifest_path:
+            return
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
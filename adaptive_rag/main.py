@@ -1,17 +1,242 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterator, List, Literal, Optional
+
 from dotenv import load_dotenv
 from langgraph.graph.state import CompiledStateGraph
+from typing_extensions import TypedDict
 
+from adaptive_rag.budget import RunBudget
+from adaptive_rag.caches import SemanticCache
 from adaptive_rag.graphs import get_adaptive_rag_graph
+from adaptive_rag.models import RAG_GENERATION_TAG
+from common.concurrency import run_sync
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerEvent(TypedDict, total=False):
+    """
+    One event of a streamed answer.
+
+    Attributes:
+        type: "token" for a piece of the answer, "retract" when the graders
+            rejected everything streamed since the last retract, "final" once
+            at the end
+        content: the token, or the accepted answer on "final"
+        time_to_first_token: seconds until the first token, on "final"
+        total_latency: seconds until the answer was accepted, on "final"
+    """
+
+    type: Literal["token", "retract", "final"]
+    content: str
+    time_to_first_token: Optional[float]
+    total_latency: float
+
+
+def get_answer_for(
+    question,
+    graph: CompiledStateGraph,
+    cache: Optional[SemanticCache] = None,
+    budget: Optional[RunBudget] = None,
+):
+    if cache is not None:
+        entry = cache.lookup(question)
+        if entry is not None:
+            return entry["generation"]
+
+    inputs, config = _run_inputs(question, budget)
+    for output in graph.stream(inputs, config):
+        for key, value in output.items():
+            pass
+    _log_budget(question, budget)
+
+    # An answer cut short by the budget was not graded, so it is not cached.
+    if cache is not None and value.get("generation") and key != "fallback":
+        cache.add(question, value["generation"], value.get("documents") or [])
+    return value["generation"]
 
 
-def get_answer_for(question, graph: CompiledStateGraph):
-    inputs = {"question": question}
-    for output in graph.stream(inputs):
+async def aget_answer_for(
+    question,
+    graph: CompiledStateGraph,
+    cache: Optional[SemanticCache] = None,
+    budget: Optional[RunBudget] = None,
+):
+    """Async version of get_answer_for."""
+    if cache is not None:
+        # The cache embeds the question with a blocking call.
+        entry = await asyncio.to_thread(cache.lookup, question)
+        if entry is not None:
+            return entry["generation"]
+
+    inputs, config = _run_inputs(question, budget)
+    async for output in graph.astream(inputs, config):
         for key, value in output.items():
             pass
+    _log_budget(question, budget)
+
+    if cache is not None and value.get("generation") and key != "fallback":
+        await asyncio.to_thread(
+            cache.add, question, value["generation"], value.get("documents") or []
+        )
     return value["generation"]
 
 
+def _run_inputs(question, budget: Optional[RunBudget]):
+    # The budget is read by the edges from the state and counts the model
+    # calls of the run as a callback.
+    if budget is None:
+        return {"question": question}, None
+    return {"question": question, "budget": budget}, {"callbacks": [budget]}
+
+
+def _log_budget(question, budget: Optional[RunBudget]):
+    if budget is None:
+        return
+    report = budget.report()
+    logger.log(
+        logging.WARNING if report["exhausted_by"] else logging.INFO,
+        "Budget of %r: %s",
+        question,
+        report,
+    )
+
+
+async def aget_answers_for(
+    questions: List[str],
+    graph: CompiledStateGraph,
+    cache: Optional[SemanticCache] = None,
+    max_concurrency: int = 8,
+    budget_factory: Optional[Callable[[], RunBudget]] = None,
+) -> List[str]:
+    """
+    Answer many questions concurrently on one event loop.
+
+    Args:
+        questions (list): The questions
+        graph (CompiledStateGraph): An adaptive RAG graph, shared by all runs
+        cache (SemanticCache): Answers to semantically identical questions
+        max_concurrency (int): Limit on questions in flight at once. Requests
+            to each provider are further limited by get_rate_limiter.
+        budget_factory (callable): Creates the RunBudget of each question,
+            e.g. functools.partial(RunBudget, max_llm_calls=10)
+
+    Returns:
+        list: The answers, in the order of the questions
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer(question):
+        async with semaphore:
+            budget = budget_factory() if budget_factory is not None else None
+            return await aget_answer_for(question, graph, cache, budget)
+
+    return await asyncio.gather(*[answer(question) for question in questions])
+
+
+def get_answers_for(
+    questions: List[str],
+    graph: CompiledStateGraph,
+    cache: Optional[SemanticCache] = None,
+    max_concurrency: int = 8,
+    budget_factory: Optional[Callable[[], RunBudget]] = None,
+) -> List[str]:
+    """Answer many questions concurrently from synchronous code."""
+    return run_sync(
+        aget_answers_for(questions, graph, cache, max_concurrency, budget_factory)
+    )
+
+
+def stream_answer_for(
+    question,
+    graph: CompiledStateGraph,
+    cache: Optional[SemanticCache] = None,
+    budget: Optional[RunBudget] = None,
+) -> Iterator[AnswerEvent]:
+    """
+    Stream the answer to a question while the graph is still grading it.
+
+    Tokens are yielded as the generate node produces them. If the graders then
+    reject the generation, a "retract" event tells the caller to discard the
+    tokens shown so far; the next generation streams in after it.
+
+    Args:
+        question (str): The question
+        graph (CompiledStateGraph): An adaptive RAG graph
+        cache (SemanticCache): Answers to semantically identical questions
+        budget (RunBudget): Limits on the LLM calls, tokens and time of the run
+
+    Returns:
+        Iterator: Token and retract events, then one final event
+    """
+    start = time.perf_counter()
+
+    if cache is not None:
+        entry = cache.lookup(question)
+        if entry is not None:
+            latency = time.perf_counter() - start
+            yield AnswerEvent(type="token", content=entry["generation"])
+            yield AnswerEvent(
+                type="final",
+                content=entry["generation"],
+                time_to_first_token=latency,
+                total_latency=latency,
+            )
+            return
+
+    first_token_at = None
+    shown = False  # tokens yielded since the last retract
+    graded = False  # the shown tokens form a complete generation under grading
+    final = {}
+    budget_exhausted = False
+    inputs, config = _run_inputs(question, budget)
+    for mode, chunk in graph.stream(
+        inputs, config, stream_mode=["messages", "updates"]
+    ):
+        if mode == "messages":
+            message, metadata = chunk
+            if RAG_GENERATION_TAG not in metadata.get("tags", []):
+                continue
+            if not message.content:
+                continue
+            if graded:
+                # Generating again: the graders found the last one unsupported.
+                yield AnswerEvent(type="retract")
+                graded = False
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            shown = True
+            yield AnswerEvent(type="token", content=message.content)
+            continue
+
+        for node, update in chunk.items():
+            if node == "generate":
+                graded = shown
+                final = update
+            elif node == "fallback":
+                final = update
+                budget_exhausted = True
+            elif shown:
+                # Back to the question: the generation was not useful.
+                yield AnswerEvent(type="retract")
+                shown = graded = False
+
+    _log_budget(question, budget)
+    generation = final.get("generation")
+    if cache is not None and generation and not budget_exhausted:
+        cache.add(question, generation, final.get("documents") or [])
+    yield AnswerEvent(
+        type="final",
+        content=generation,
+        time_to_first_token=(
+            first_token_at - start if first_token_at is not None else None
+        ),
+        total_latency=time.perf_counter() - start,
+    )
+
+
 if __name__ == "__main__":
     load_dotenv()
 
@@ -1,48 +1,341 @@
-from typing import Literal
+import hashlib
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+from typing import List, Literal, Optional
 
-from langchain import hub
-from langchain_community.document_loaders import WebBaseLoader
 from langchain_community.tools import TavilySearchResults
 from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.prompts import BasePromptTemplate, ChatPromptTemplate
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.vectorstores import VectorStore
+from langchain_openai import ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pydantic import BaseModel, Field
 
+from adaptive_rag.caches import get_response_cache, response_cache_enabled
+from adaptive_rag.ingestion import CorpusIngestor
+from adaptive_rag.retrievers import (
+    BM25Index,
+    HybridRetriever,
+    VectorRetriever,
+    stored_documents,
+)
+from adaptive_rag.vectorstores import NumpyVectorStore
+from common.concurrency import file_lock
+from common.embeddings import get_cached_embeddings
+from common.prompts import RAG_PROMPT_NAME, get_prompt
+
+
+CORPUS_URLS = [
+    "https://lilianweng.github.io/posts/2023-06-23-agent/",
+    "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
+    "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
+]
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 0
+FINGERPRINT_FILENAME = "FINGERPRINT"
+MANIFEST_FILENAME = "manifest.json"
+LOCK_SUFFIX = ".lock"
+# Tags the answer generation so its tokens can be told apart from the graders'.
+RAG_GENERATION_TAG = "rag_generation"
+
+
+def get_corpus_fingerprint(
+    chunk_size: int, chunk_overlap: int, embedding_model: str, backend: str = "chroma"
+) -> str:
+    """
+    Hash the settings that determine how every source is indexed.
+
+    The sources themselves are not part of the fingerprint: they are tracked one
+    by one in the ingestion manifest, so adding, changing or removing a source
+    only touches its own chunks.
+
+    Args:
+        chunk_size (int): Splitter chunk size in tokens
+        chunk_overlap (int): Splitter chunk overlap in tokens
+        embedding_model (str): Name of the embedding model
+        backend (str): Vector store backend holding the index
+
+    Returns:
+        str: Hex digest identifying the index
+    """
+    payload = json.dumps(
+        {
+            "splitter": "tiktoken",
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "embedding_model": embedding_model,
+            "backend": backend,
+            # Relevance scores are cosine similarities, see get_vectorstore.
+            "distance": "cosine",
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_fingerprint(index_directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(index_directory, FINGERPRINT_FILENAME)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
 
-def get_retriever():
-    urls = [
-        "https://lilianweng.github.io/posts/2023-06-23-agent/",
-        "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
-        "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
-    ]
+def _remove_stale_indexes(persist_directory: str, fingerprint: str):
+    for name in os.listdir(persist_directory):
+        path = os.path.join(persist_directory, name)
+        stale = _read_fingerprint(path)
+        if stale is not None and stale != fingerprint:
+            with file_lock(path + LOCK_SUFFIX):
+                shutil.rmtree(path, ignore_errors=True)
 
-    docs = [WebBaseLoader(url).load() for url in urls]
-    docs_list = [item for sublist in docs for item in sublist]
 
+def get_vectorstore(
+    embedding: Embeddings,
+    backend: str,
+    persist_directory: Optional[str] = None,
+    dtype: str = "float32",
+    rescore_candidates: int = 0,
+) -> VectorStore:
+    """
+    Create an empty or load a persisted vector store.
+
+    On both backends the relevance scores of a search are cosine similarities.
+
+    Args:
+        embedding (Embeddings): Embedding model of the store
+        backend (str): "chroma" or "numpy"
+        persist_directory (str): Where the store is persisted, in memory if None
+        dtype (str): Storage of the numpy backend, "float32", "float16" or "int8"
+        rescore_candidates (int): Quantized candidates re-scored at full precision
+
+    Returns:
+        VectorStore: The vector store
+    """
+    if backend == "numpy":
+        return NumpyVectorStore(
+            embedding,
+            persist_directory=persist_directory,
+            dtype=dtype,
+            rescore_candidates=rescore_candidates,
+        )
+    elif dtype != "float32":
+        raise ValueError(f"The {backend} backend only stores float32 vectors")
+    elif backend == "chroma":
+        return Chroma(
+            collection_name="rag-chroma",
+            embedding_function=embedding,
+            persist_directory=persist_directory,
+            # Makes relevance scores cosine similarities, as for the numpy store.
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+    else:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def get_corpus_vectorstore(
+    persist_directory: Optional[str] = None,
+    refresh: bool = False,
+    max_age: Optional[float] = None,
+    backend: Optional[str] = None,
+    dtype: Optional[str] = None,
+    rescore_candidates: Optional[int] = None,
+) -> VectorStore:
+    """
+    Build the vector store over the blog corpus.
+
+    Without a persist directory the corpus is fetched, split and embedded into
+    an in-memory collection on every call. With one, the collection is stored
+    under a sub-directory named after the corpus fingerprint and reused by
+    later processes until the splitter settings or embedding model change.
+    Sources added to or removed from the corpus are indexed incrementally.
+    Sources already indexed are re-checked for changes when refresh is set or
+    the index is older than max_age, and only changed ones are re-embedded.
+
+    Args:
+        persist_directory (str): Directory for persisted indexes, defaults to
+            the ADAPTIVE_RAG_INDEX_DIR environment variable
+        refresh (bool): Re-check every source of a persisted index for changes
+        max_age (float): Seconds after which the sources of a persisted index
+            are re-checked when it is opened, defaults to the
+            ADAPTIVE_RAG_INDEX_MAX_AGE environment variable; never if unset,
+            on every open if 0
+        backend (str): Vector store backend, "chroma" or "numpy", defaults to
+            the ADAPTIVE_RAG_VECTOR_BACKEND environment variable or "chroma"
+        dtype (str): Vector storage of the numpy backend, "float32", "float16"
+            or "int8", defaults to ADAPTIVE_RAG_VECTOR_DTYPE or "float32"
+        rescore_candidates (int): Number of quantized candidates re-scored at
+            full precision, defaults to ADAPTIVE_RAG_RESCORE_CANDIDATES or 0
+
+    Returns:
+        VectorStore: The indexed corpus
+    """
+    persist_directory = persist_directory or os.getenv("ADAPTIVE_RAG_INDEX_DIR")
+    backend = backend or os.getenv("ADAPTIVE_RAG_VECTOR_BACKEND", "chroma")
+    dtype = dtype or os.getenv("ADAPTIVE_RAG_VECTOR_DTYPE", "float32")
+    if rescore_candidates is None:
+        rescore_candidates = int(os.getenv("ADAPTIVE_RAG_RESCORE_CANDIDATES", "0"))
+    if max_age is None and os.getenv("ADAPTIVE_RAG_INDEX_MAX_AGE"):
+        max_age = float(os.environ["ADAPTIVE_RAG_INDEX_MAX_AGE"])
+    embedding = get_cached_embeddings()
     text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=500, chunk_overlap=0
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
     )
-    doc_splits = text_splitter.split_documents(docs_list)
 
-    vectorstore = Chroma.from_documents(
-        documents=doc_splits,
-        collection_name="rag-chroma",
-        embedding=OpenAIEmbeddings(),
+    if not persist_directory:
+        vectorstore = get_vectorstore(
+            embedding, backend, dtype=dtype, rescore_candidates=rescore_candidates
+        )
+        CorpusIngestor(vectorstore, text_splitter).refresh(CORPUS_URLS)
+        return vectorstore
+
+    fingerprint = get_corpus_fingerprint(
+        CHUNK_SIZE, CHUNK_OVERLAP, embedding.model, backend
     )
-    return vectorstore.as_retriever()
+    index_directory = os.path.join(persist_directory, fingerprint[:16])
+    os.makedirs(persist_directory, exist_ok=True)
+    # Workers starting together take turns: the first builds the index, the
+    # others wait and then open it, instead of deleting each other's files.
+    with file_lock(index_directory + LOCK_SUFFIX):
+        complete = _read_fingerprint(index_directory) == fingerprint
+        if not complete:
+            # Missing or half-built index: start over. The marker is only
+            # written once the first build finished, so an interrupted build
+            # is never mistaken for a complete one.
+            shutil.rmtree(index_directory, ignore_errors=True)
+            os.makedirs(index_directory, exist_ok=True)
+
+        # The quantized copies are derived from the stored float32 vectors, so
+        # the dtype is not part of the fingerprint.
+        vectorstore = get_vectorstore(
+            embedding, backend, index_directory, dtype, rescore_candidates
+        )
+        ingestor = CorpusIngestor(
+            vectorstore,
+            text_splitter,
+            manifest_path=os.path.join(index_directory, MANIFEST_FILENAME),
+        )
+        checked_at = ingestor.checked_at()
+        if max_age is not None and checked_at is not None:
+            refresh = refresh or time.time() - checked_at >= max_age
+        if refresh or not complete or set(ingestor.sources()) != set(CORPUS_URLS):
+            ingestor.refresh(CORPUS_URLS)
+
+        if not complete:
+            with open(os.path.join(index_directory, FINGERPRINT_FILENAME), "w") as f:
+                f.write(fingerprint)
+    if not complete:
+        _remove_stale_indexes(persist_directory, fingerprint)
+    return vectorstore
+
+
+def get_retriever(
+    vectorstore: Optional[VectorStore] = None, hybrid: Optional[bool] = None, **kwargs
+) -> BaseRetriever:
+    """
+    Build the retriever over the blog corpus.
+
+    Args:
+        vectorstore (VectorStore): The indexed corpus, built with
+            get_corpus_vectorstore(**kwargs) if not given
+        hybrid (bool): Fuse BM25 keyword search with the vector search,
+            defaults to the ADAPTIVE_RAG_HYBRID_RETRIEVAL environment variable
+
+    Returns:
+        BaseRetriever: Retriever over the corpus
+    """
+    if vectorstore is None:
+        vectorstore = get_corpus_vectorstore(**kwargs)
+    if hybrid is None:
+        hybrid = os.getenv("ADAPTIVE_RAG_HYBRID_RETRIEVAL", "").lower() in ["1", "true"]
+
+    if not hybrid:
+        return VectorRetriever(vectorstore=vectorstore)
+    # Built from the store after ingestion, so it covers exactly the indexed chunks.
+    bm25 = BM25Index.from_documents(stored_documents(vectorstore))
+    return HybridRetriever(vectorstore=vectorstore, bm25=bm25)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(provider: str) -> Optional[InMemoryRateLimiter]:
+    """
+    Process-wide request rate limit shared by every client of a provider.
+
+    The rate is read from ADAPTIVE_RAG_<PROVIDER>_REQUESTS_PER_SECOND, e.g.
+    ADAPTIVE_RAG_OPENAI_REQUESTS_PER_SECOND=5. Without it requests are not limited.
+
+    Args:
+        provider (str): "openai" or "tavily"
+
+    Returns:
+        InMemoryRateLimiter: The limiter, or None when unlimited
+    """
+    rate = os.environ.get(f"ADAPTIVE_RAG_{provider.upper()}_REQUESTS_PER_SECOND")
+    if not rate:
+        return None
+    return InMemoryRateLimiter(
+        requests_per_second=float(rate),
+        check_every_n_seconds=0.05,
+        max_bucket_size=max(1.0, float(rate)),
+    )
+
+
+def rate_limited(
+    runnable: Runnable, rate_limiter: Optional[InMemoryRateLimiter]
+) -> Runnable:
+    """Wait for the rate limiter before each call of a runnable."""
+    if rate_limiter is None:
+        return runnable
+
+    def acquire(inputs):
+        rate_limiter.acquire()
+        return inputs
+
+    async def aacquire(inputs):
+        await rate_limiter.aacquire()
+        return inputs
+
+    return RunnableLambda(acquire, afunc=aacquire) | runnable
 
 
 def get_web_search_tool():
-    return TavilySearchResults(k=3)
+    return rate_limited(TavilySearchResults(k=3), get_rate_limiter("tavily"))
+
 
+def get_model(cache_name: Optional[str] = None):
+    """
+    Chat model shared by the chains.
+
+    Args:
+        cache_name (str): Name of the chain, which gets its own exact-match
+            response cache. Without one, or with the cache turned off by the
+            ADAPTIVE_RAG_RESPONSE_CACHE environment variable, responses are
+            not cached.
 
-def get_model():
-    return ChatOpenAI(model="gpt-3.5-turbo-0125", temperature=0)
+    Returns:
+        ChatOpenAI: The chat model
+    """
+    cache = None
+    if cache_name and response_cache_enabled():
+        cache = get_response_cache(cache_name)
+    return ChatOpenAI(
+        model="gpt-3.5-turbo-0125",
+        temperature=0,
+        cache=cache,
+        rate_limiter=get_rate_limiter("openai"),
+    )
 
 
-def get_question_router():
+def get_question_router(model: Optional[BaseChatModel] = None):
     class RouteQuery(BaseModel):
         """Route a user query to the most relevant datasource."""
 
@@ -51,7 +344,8 @@ def get_question_router():
             description="Given a user question choose to route it to web search or a vectorstore.",
         )
 
-    structured_model = get_model().with_structured_output(RouteQuery)
+    model = model or get_model("question_router")
+    structured_model = model.with_structured_output(RouteQuery)
 
     system = """You are an expert at routing a user question to a vectorstore or web search.
     The vectorstore contains documents related to agents, prompt engineering, and adversarial attacks.
@@ -63,10 +357,10 @@ def get_question_router():
         ]
     )
 
-    return route_prompt | structured_model
+    return (route_prompt | structured_model).with_config(run_name="question_router")
 
 
-def get_retrieval_grader():
+def get_retrieval_grader(model: Optional[BaseChatModel] = None):
     class GradeDocuments(BaseModel):
         """Binary score for relevance check on retrieved documents."""
 
@@ -74,7 +368,8 @@ def get_retrieval_grader():
             description="Documents are relevant to the question, 'yes' or 'no'"
         )
 
-    structured_llm_grader = get_model().with_structured_output(GradeDocuments)
+    model = model or get_model("retrieval_grader")
+    structured_llm_grader = model.with_structured_output(GradeDocuments)
     system = """You are a grader assessing relevance of a retrieved document to a user question. \n 
         If the document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n
         It does not need to be a stringent test. The goal is to filter out erroneous retrievals. \n
@@ -88,11 +383,52 @@ def get_retrieval_grader():
             ),
         ]
     )
-    return grade_prompt | structured_llm_grader
+    return (grade_prompt | structured_llm_grader).with_config(
+        run_name="retrieval_grader"
+    )
+
+
+def get_batch_retrieval_grader(model: Optional[BaseChatModel] = None):
+    class GradeDocumentsBatch(BaseModel):
+        """Binary scores for relevance check on a list of retrieved documents."""
+
+        binary_scores: List[Literal["yes", "no"]] = Field(
+            description="One score per document, in the order the documents are given. "
+            "'yes' if the document is relevant to the question, 'no' otherwise"
+        )
+
+    model = model or get_model("batch_retrieval_grader")
+    structured_llm_grader = model.with_structured_output(GradeDocumentsBatch)
+    system = """You are a grader assessing relevance of retrieved documents to a user question. \n 
+        Each document is given with its index. \n
+        If a document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n
+        It does not need to be a stringent test. The goal is to filter out erroneous retrievals. \n
+        Give one binary score 'yes' or 'no' per document, in the same order as the documents."""
+    grade_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", system),
+            (
+                "human",
+                "Retrieved documents: \n\n {documents} \n\n User question: {question}",
+            ),
+        ]
+    )
+    return (grade_prompt | structured_llm_grader).with_config(
+        run_name="batch_retrieval_grader"
+    )
 
 
-def get_rag_chain():
-    prompt = hub.pull("rlm/rag-prompt")
+def format_documents_for_grading(documents: List[str]) -> str:
+    return "\n\n".join(
+        f"Document {index}:\n{document}" for index, document in enumerate(documents)
+    )
+
+
+def get_rag_chain(
+    model: Optional[BaseChatModel] = None,
+    prompt: Optional[BasePromptTemplate] = None,
+):
+    prompt = prompt or get_prompt(RAG_PROMPT_NAME)
     """
     You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question.\n
     If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
@@ -100,10 +436,11 @@ def get_rag_chain():
     Context: {context} 
     Answer:"""
 
-    return prompt | get_model() | StrOutputParser()
+    rag_chain = prompt | (model or get_model("rag_chain")) | StrOutputParser()
+    return rag_chain.with_config(run_name="rag_chain", tags=[RAG_GENERATION_TAG])
 
 
-def get_hallucination_grader():
+def get_hallucination_grader(model: Optional[BaseChatModel] = None):
     class GradeHallucinations(BaseModel):
         """Binary score for hallucination present in generation answer."""
 
@@ -111,7 +448,8 @@ def get_hallucination_grader():
             description="Answer is grounded in the facts, 'yes' or 'no'"
         )
 
-    structured_model = get_model().with_structured_output(GradeHallucinations)
+    model = model or get_model("hallucination_grader")
+    structured_model = model.with_structured_output(GradeHallucinations)
 
     system = """You are a grader assessing whether an LLM generation is grounded in / supported by a set of retrieved facts. \n 
         Give a binary score 'yes' or 'no'. 'Yes' means that the answer is grounded in / supported by the set of facts."""
@@ -125,10 +463,12 @@ def get_hallucination_grader():
         ]
     )
 
-    return hallucination_prompt | structured_model
+    return (hallucination_prompt | structured_model).with_config(
+        run_name="hallucination_grader"
+    )
 
 
-def get_answer_grader():
+def get_answer_grader(model: Optional[BaseChatModel] = None):
     class GradeAnswer(BaseModel):
         """Binary score to assess answer addresses question."""
 
@@ -136,7 +476,8 @@ def get_answer_grader():
             description="Answer addresses the question, 'yes' or 'no'"
         )
 
-    structured_model = get_model().with_structured_output(GradeAnswer)
+    model = model or get_model("answer_grader")
+    structured_model = model.with_structured_output(GradeAnswer)
     system = """You are a grader assessing whether an answer addresses / resolves a question \n 
         Give a binary score 'yes' or 'no'. Yes' means that the answer resolves the question."""
     answer_prompt = ChatPromptTemplate.from_messages(
@@ -148,10 +489,10 @@ def get_answer_grader():
             ),
         ]
     )
-    return answer_prompt | structured_model
+    return (answer_prompt | structured_model).with_config(run_name="answer_grader")
 
 
-def get_question_rewriter():
+def get_question_rewriter(model: Optional[BaseChatModel] = None):
     system = """You a question re-writer that converts an input question to a better version that is optimized \n 
         for vectorstore retrieval. Look at the input and try to reason about the underlying semantic intent / meaning."""
     re_write_prompt = ChatPromptTemplate.from_messages(
@@ -164,4 +505,6 @@ def get_question_rewriter():
         ]
     )
 
-    return re_write_prompt | get_model() | StrOutputParser()
+    model = model or get_model("question_rewriter")
+    question_rewriter = re_write_prompt | model | StrOutputParser()
+    return question_rewriter.with_config(run_name="question_rewriter")
@@ -1,88 +1,294 @@
-from dotenv import load_dotenv
+from typing import List, Optional
+
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
 
-from adaptive_rag.models import (
-    get_retriever,
-    get_rag_chain,
-    get_retrieval_grader,
-    get_question_rewriter,
-    get_web_search_tool,
-)
+from adaptive_rag.budget import BUDGET_EXHAUSTED_ANSWER
+from adaptive_rag.components import get_components, get_setting
+from adaptive_rag.models import format_documents_for_grading
+from adaptive_rag.packing import DEFAULT_CONTEXT_TOKEN_BUDGET, pack_documents
+from adaptive_rag.retrievers import relevance_scores
 from adaptive_rag.states import GraphState
 
-load_dotenv()
-retriever = get_retriever()
-rag_chain = get_rag_chain()
-retrieval_grader = get_retrieval_grader()
-question_rewriter = get_question_rewriter()
-web_search_tool = get_web_search_tool()
-
 
-def retrieve(state: GraphState) -> GraphState:
+def retrieve(state: GraphState, config: RunnableConfig) -> GraphState:
     """
     Retrieve documents
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
         state (dict): New key added to state, documents, that contains retrieved documents
     """
     question = state["question"]
+    components = get_components(config)
+
+    documents = components.retriever.invoke(question)
+    return {
+        "documents": documents,
+        "scores": _retrieval_scores(documents, config),
+        "question": question,
+        "generation": None,
+    }
+
+
+async def aretrieve(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Async version of retrieve."""
+    question = state["question"]
+    components = get_components(config)
+
+    documents = await components.retriever.ainvoke(question)
+    return {
+        "documents": documents,
+        "scores": _retrieval_scores(documents, config),
+        "question": question,
+        "generation": None,
+    }
+
 
-    documents = retriever.invoke(question)
-    return {"documents": documents, "question": question, "generation": None}
+def _retrieval_scores(
+    documents: List[Document], config: RunnableConfig
+) -> Optional[List[Optional[float]]]:
+    # The similarities computed by the vector search itself, so thresholding
+    # costs no embedding calls.
+    if not get_setting(config, "grading_score_thresholds"):
+        return None
+    return relevance_scores(documents)
 
 
-def generate(state: GraphState) -> GraphState:
+def generate(state: GraphState, config: RunnableConfig) -> GraphState:
     """
     Generate answer
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
-        state (dict): New key added to state, generation, that contains LLM generation
+        state (dict): New key added to state, generation, that contains LLM generation,
+            and documents replaced with the packed context it was generated from
     """
     question = state["question"]
-    documents = state["documents"]
+    context, context_stats = _pack_context(state, config)
+
+    rag_chain = get_components(config).rag_chain
+    generation = rag_chain.invoke({"context": context, "question": question})
+    return {
+        "documents": context,
+        "scores": None,
+        "question": question,
+        "generation": generation,
+        "latest_generation": generation,
+        "context_stats": context_stats,
+    }
+
+
+async def agenerate(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Async version of generate."""
+    question = state["question"]
+    context, context_stats = _pack_context(state, config)
 
-    generation = rag_chain.invoke({"context": documents, "question": question})
-    return {"documents": documents, "question": question, "generation": generation}
+    rag_chain = get_components(config).rag_chain
+    generation = await rag_chain.ainvoke({"context": context, "question": question})
+    return {
+        "documents": context,
+        "scores": None,
+        "question": question,
+        "generation": generation,
+        "latest_generation": generation,
+        "context_stats": context_stats,
+    }
 
 
-def grade_documents(state: GraphState) -> GraphState:
+def fallback(state: GraphState) -> GraphState:
+    """
+    End the run with the latest generation once its budget is exhausted.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Updates generation key with the latest generation, which
+            may not have passed the graders
+    """
+    generation = state.get("latest_generation") or BUDGET_EXHAUSTED_ANSWER
+    return {"generation": generation}
+
+
+def _pack_context(state: GraphState, config: RunnableConfig):
+    # Duplicate chunks dropped, best first, cut to the token budget.
+    return pack_documents(
+        state["documents"],
+        token_budget=get_setting(
+            config, "context_token_budget", DEFAULT_CONTEXT_TOKEN_BUDGET
+        ),
+        scores=state.get("scores"),
+        encoding=get_components(config).token_encoding,
+    )
+
+
+def grade_documents(state: GraphState, config: RunnableConfig) -> GraphState:
     """
     Determines whether the retrieved documents are relevant to the question.
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
         state (dict): Updates documents key with only filtered relevant documents
     """
     question = state["question"]
     documents = state["documents"]
+    scores = state.get("scores") or [None] * len(documents)
 
-    filtered_docs = []
-    for document in documents:
-        score = retrieval_grader.invoke(
-            {"question": question, "document": document.page_content}
+    grades = _grades_from_scores(scores, config)
+    uncertain = [index for index, grade in enumerate(grades) if grade is None]
+    uncertain_documents = [documents[index] for index in uncertain]
+    if get_setting(config, "grading_mode", "per_document") == "single_call":
+        llm_grades = _grade_in_single_call(question, uncertain_documents, config)
+    else:
+        llm_grades = _grade_per_document(question, uncertain_documents, config)
+    for index, grade in zip(uncertain, llm_grades):
+        grades[index] = grade
+
+    return _keep_relevant(question, documents, scores, grades)
+
+
+async def agrade_documents(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Async version of grade_documents."""
+    question = state["question"]
+    documents = state["documents"]
+    scores = state.get("scores") or [None] * len(documents)
+
+    grades = _grades_from_scores(scores, config)
+    uncertain = [index for index, grade in enumerate(grades) if grade is None]
+    uncertain_documents = [documents[index] for index in uncertain]
+    if get_setting(config, "grading_mode", "per_document") == "single_call":
+        llm_grades = await _agrade_in_single_call(
+            question, uncertain_documents, config
         )
-        grade = score.binary_score
+    else:
+        llm_grades = await _agrade_per_document(question, uncertain_documents, config)
+    for index, grade in zip(uncertain, llm_grades):
+        grades[index] = grade
+
+    return _keep_relevant(question, documents, scores, grades)
+
+
+def _grades_from_scores(
+    scores: List[Optional[float]], config: RunnableConfig
+) -> List[Optional[str]]:
+    # Documents with a clearly high or low similarity are decided without the
+    # LLM grader; only the band in between is graded.
+    grades = [None] * len(scores)
+    thresholds = get_setting(config, "grading_score_thresholds")
+    if thresholds:
+        lower, upper = thresholds
+        for index, score in enumerate(scores):
+            if score is not None and score >= upper:
+                grades[index] = "yes"
+            elif score is not None and score < lower:
+                grades[index] = "no"
+    return grades
+
+
+def _keep_relevant(question, documents, scores, grades) -> GraphState:
+    filtered_docs = []
+    filtered_scores = []
+    for document, score, grade in zip(documents, scores, grades):
         if grade == "yes":
             filtered_docs.append(document)
+            filtered_scores.append(score)
         else:
             continue
-    return {"documents": filtered_docs, "question": question, "generation": None}
+    return {
+        "documents": filtered_docs,
+        "scores": filtered_scores,
+        "question": question,
+        "generation": None,
+    }
+
+
+def _grade_per_document(
+    question: str, documents: List[Document], config: RunnableConfig
+) -> List[str]:
+    retrieval_grader = get_components(config).retrieval_grader
+    # Grade every document concurrently; batch keeps the results in input order.
+    scores = retrieval_grader.batch(
+        [
+            {"question": question, "document": document.page_content}
+            for document in documents
+        ],
+        config={"max_concurrency": get_setting(config, "grading_max_concurrency")},
+    )
+    return [score.binary_score for score in scores]
+
+
+def _grade_in_single_call(
+    question: str, documents: List[Document], config: RunnableConfig
+) -> List[str]:
+    if not documents:
+        return []
+
+    batch_retrieval_grader = get_components(config).batch_retrieval_grader
+    score = batch_retrieval_grader.invoke(
+        {
+            "question": question,
+            "documents": format_documents_for_grading(
+                [document.page_content for document in documents]
+            ),
+        }
+    )
+    if len(score.binary_scores) != len(documents):
+        # The model lost track of the documents; grade them one by one instead.
+        return _grade_per_document(question, documents, config)
+    return score.binary_scores
+
+
+async def _agrade_per_document(
+    question: str, documents: List[Document], config: RunnableConfig
+) -> List[str]:
+    retrieval_grader = get_components(config).retrieval_grader
+    scores = await retrieval_grader.abatch(
+        [
+            {"question": question, "document": document.page_content}
+            for document in documents
+        ],
+        config={"max_concurrency": get_setting(config, "grading_max_concurrency")},
+    )
+    return [score.binary_score for score in scores]
+
+
+async def _agrade_in_single_call(
+    question: str, documents: List[Document], config: RunnableConfig
+) -> List[str]:
+    if not documents:
+        return []
+
+    batch_retrieval_grader = get_components(config).batch_retrieval_grader
+    score = await batch_retrieval_grader.ainvoke(
+        {
+            "question": question,
+            "documents": format_documents_for_grading(
+                [document.page_content for document in documents]
+            ),
+        }
+    )
+    if len(score.binary_scores) != len(documents):
+        return await _agrade_per_document(question, documents, config)
+    return score.binary_scores
 
 
-def transform_query(state: GraphState) -> GraphState:
+def transform_query(state: GraphState, config: RunnableConfig) -> GraphState:
     """
     Transform the query to produce a better question.
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
         state (dict): Updates question key with a re-phrased question
@@ -90,24 +296,62 @@ def transform_query(state: GraphState) -> GraphState:
     question = state["question"]
     documents = state["documents"]
 
+    question_rewriter = get_components(config).question_rewriter
     better_question = question_rewriter.invoke({"question": question})
     return {"documents": documents, "question": better_question, "generation": None}
 
 
-def web_search(state: GraphState) -> GraphState:
+async def atransform_query(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Async version of transform_query."""
+    question = state["question"]
+    documents = state["documents"]
+
+    question_rewriter = get_components(config).question_rewriter
+    better_question = await question_rewriter.ainvoke({"question": question})
+    return {"documents": documents, "question": better_question, "generation": None}
+
+
+def web_search(state: GraphState, config: RunnableConfig) -> GraphState:
     """
     Web search based on the re-phrased question.
 
     Args:
         state (dict): The current graph state
+        config (RunnableConfig): The run config, may carry injected components
 
     Returns:
         state (dict): Updates documents key with appended web results
     """
     question = state["question"]
 
-    documents = web_search_tool.invoke({"query": question})
-    web_content = "\n".join([document["content"] for document in documents])
-    web_results = [Document(page_content=web_content)]
+    web_search_tool = get_components(config).web_search_tool
+    results = web_search_tool.invoke({"query": question})
+    return {
+        "documents": _web_documents(results),
+        "scores": None,
+        "question": question,
+        "generation": None,
+    }
+
+
+async def aweb_search(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Async version of web_search."""
+    question = state["question"]
+
+    web_search_tool = get_components(config).web_search_tool
+    results = await web_search_tool.ainvoke({"query": question})
+    return {
+        "documents": _web_documents(results),
+        "scores": None,
+        "question": question,
+        "generation": None,
+    }
+
 
-    return {"documents": web_results, "question": question, "generation": None}
+def _web_documents(results: List[dict]) -> List[Document]:
+    # One document per result, in Tavily's ranking, so that packing can drop
+    # duplicates and trim the least relevant results first.
+    return [
+        Document(page_content=result["content"], metadata={"source": result["url"]})
+        for result in results
+    ]
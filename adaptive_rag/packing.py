@@ -0,0 +1,173 @@
+import logging
+import re
+from functools import lru_cache
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+import tiktoken
+from langchain_core.documents import Document
+from typing_extensions import TypedDict
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+# A trimmed tail shorter than this is dropped rather than sent as a fragment.
+MIN_TRIMMED_TOKENS = 50
+
+logger = logging.getLogger(__name__)
+
+
+class PackingStats(TypedDict):
+    """
+    What packing did to the context of one generation.
+
+    Attributes:
+        documents_in: documents before packing
+        documents_out: documents sent to the model
+        duplicates_removed: near-identical documents dropped
+        input_tokens: tokens of all documents before packing
+        packed_tokens: tokens of the packed context
+        tokens_saved: input_tokens - packed_tokens
+    """
+
+    documents_in: int
+    documents_out: int
+    duplicates_removed: int
+    input_tokens: int
+    packed_tokens: int
+    tokens_saved: int
+
+
+class TokenEncoding(Protocol):
+    """Splits text into tokens and joins them back, like tiktoken.Encoding."""
+
+    def encode(self, text: str) -> Sequence: ...
+
+    def decode(self, tokens: Sequence) -> str: ...
+
+
+class CharacterEncoding:
+    """
+    Approximate tokenizer cutting text into pieces of a few characters.
+
+    Needs no data files. With the default of four characters per token it
+    estimates English token counts of OpenAI models closely enough to pack a
+    context budget.
+    """
+
+    def __init__(self, characters_per_token: int = 4):
+        self.characters_per_token = characters_per_token
+
+    def encode(self, text: str) -> List[str]:
+        step = self.characters_per_token
+        return [text[start : start + step] for start in range(0, len(text), step)]
+
+    def decode(self, tokens: Sequence[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo") -> TokenEncoding:
+    """
+    The tiktoken encoding of a model, loaded once per process.
+
+    tiktoken downloads the encoding on first use. When the download or the
+    cached file can't be read, a CharacterEncoding estimate is used instead
+    and a warning is logged; any other error is raised. Callers that are
+    offline by design should pass CharacterEncoding themselves.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except OSError as e:
+        # requests' errors, raised for a failed download, are OSErrors too.
+        logger.warning("Estimating token counts, tiktoken failed to load: %r", e)
+        return CharacterEncoding()
+
+
+def pack_documents(
+    documents: Sequence[Document],
+    token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    scores: Optional[Sequence[Optional[float]]] = None,
+    duplicate_threshold: float = 0.9,
+    encoding: Optional[TokenEncoding] = None,
+) -> Tuple[List[Document], PackingStats]:
+    """
+    Fit documents into a token budget for the generation prompt.
+
+    Near-identical documents are dropped, the rest are ordered by relevance
+    (by score when known, otherwise in retrieval order) and added until the
+    budget is spent. The document that crosses the budget is trimmed.
+
+    Args:
+        documents (list): Retrieved or web search documents
+        token_budget (int): Maximum tokens of page content to keep
+        scores (list): Relevance of each document, None where unknown
+        duplicate_threshold (float): Shingle Jaccard similarity from which two
+            documents count as duplicates
+        encoding (TokenEncoding): Tokenizer counting the budget, the tiktoken
+            encoding of the generation model if not given
+
+    Returns:
+        tuple: The packed documents and the packing stats
+    """
+    encoding = encoding or get_encoding()
+    scores = list(scores) if scores else [None] * len(documents)
+    tokens = [encoding.encode(document.page_content) for document in documents]
+
+    # Stable sort: equal or unknown scores keep their retrieval order.
+    order = sorted(
+        range(len(documents)),
+        key=lambda index: -scores[index] if scores[index] is not None else 0,
+    )
+
+    kept: List[int] = []
+    kept_shingles: List[set] = []
+    duplicates = 0
+    for index in order:
+        document_shingles = shingles(documents[index].page_content)
+        if any(
+            jaccard(document_shingles, other) >= duplicate_threshold
+            for other in kept_shingles
+        ):
+            duplicates += 1
+            continue
+        kept.append(index)
+        kept_shingles.append(document_shingles)
+
+    packed: List[Document] = []
+    packed_tokens = 0
+    for index in kept:
+        remaining = token_budget - packed_tokens
+        if len(tokens[index]) <= remaining:
+            packed.append(documents[index])
+            packed_tokens += len(tokens[index])
+            continue
+        if remaining >= MIN_TRIMMED_TOKENS:
+            packed.append(
+                Document(
+                    page_content=encoding.decode(tokens[index][:remaining]),
+                    metadata=documents[index].metadata,
+                )
+            )
+            packed_tokens += remaining
+        break
+
+    input_tokens = sum(len(document_tokens) for document_tokens in tokens)
+    return packed, PackingStats(
+        documents_in=len(documents),
+        documents_out=len(packed),
+        duplicates_removed=duplicates,
+        input_tokens=input_tokens,
+        packed_tokens=packed_tokens,
+        tokens_saved=input_tokens - packed_tokens,
+    )
+
+
+def shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,240 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+# Latin letters and digits form one token, runs of other word characters
+# (e.g. Hangul) another, so "Self-reflection의" gives "self", "reflection", "의".
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[^\W\da-z_]+")
+# Metadata key of the dense relevance score of a retrieved document.
+RELEVANCE_SCORE_KEY = "relevance_score"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index scoring documents with Okapi BM25.
+
+    Only the postings of the query terms are visited, so a search costs in
+    proportion to how common those terms are, not to the corpus size. The
+    index only grows: after chunks are deleted from the vector store, e.g. by
+    a corpus refresh, build a new one from the store with from_documents.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._documents: Dict[int, Document] = {}
+        self._lengths: Dict[int, int] = {}
+        self._keys: Dict[Tuple, int] = {}
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add_documents(documents)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add_documents(self, documents: List[Document]):
+        with self._lock:
+            for document in documents:
+                key = document_key(document)
+                if key in self._keys:
+                    continue
+                doc_id = self._next_id
+                self._next_id += 1
+                terms = Counter(tokenize(document.page_content))
+                for term, frequency in terms.items():
+                    self._postings[term][doc_id] = frequency
+                self._documents[doc_id] = document
+                self._lengths[doc_id] = sum(terms.values())
+                self._keys[key] = doc_id
+                self._total_length += self._lengths[doc_id]
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Find the documents with the highest BM25 score for a query.
+
+        Args:
+            query (str): The query
+            k (int): Number of documents to return
+
+        Returns:
+            list: (document, score) pairs, best first
+        """
+        with self._lock:
+            n_documents = len(self._documents)
+            if not n_documents:
+                return []
+            average_length = self._total_length / n_documents
+
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (n_documents - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (
+                        1 - self.b + self.b * self._lengths[doc_id] / average_length
+                    )
+                    scores[doc_id] += (
+                        idf * frequency * (self.k1 + 1) / (frequency + norm)
+                    )
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._documents[doc_id], score) for doc_id, score in best]
+
+
+class VectorRetriever(BaseRetriever):
+    """
+    Dense vector search that keeps the relevance score of each document.
+
+    The score, the cosine similarity reported by the vector store, is set in
+    the metadata of the returned documents under RELEVANCE_SCORE_KEY, so it
+    can be used without embedding the query or the documents again.
+    """
+
+    vectorstore: VectorStore
+    k: int = 4
+
+    def search_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        """
+        Top-k documents with their relevance score.
+
+        Args:
+            query (str): The query
+
+        Returns:
+            list: (document, relevance score) pairs, best first
+        """
+        return self.vectorstore.similarity_search_with_relevance_scores(
+            query, k=self.k
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return scored_documents(self.search_with_scores(query))
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense vector search and BM25 keyword search fused with reciprocal rank fusion.
+
+    Each ranking contributes 1 / (rrf_k + rank) per document, so chunks that
+    match rare exact terms such as names or acronyms surface even when their
+    embedding similarity is mediocre. Documents found by the vector search
+    carry their relevance score in their metadata, like with VectorRetriever.
+    """
+
+    vectorstore: VectorStore
+    bm25: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def search_with_scores(
+        self, query: str
+    ) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Fused top-k documents with their dense relevance score.
+
+        Args:
+            query (str): The query
+
+        Returns:
+            list: (document, relevance score) pairs, best first. The score is
+                None for documents found only by keyword search.
+        """
+        dense = self.vectorstore.similarity_search_with_relevance_scores(
+            query, k=self.fetch_k
+        )
+        sparse = self.bm25.search(query, k=self.fetch_k)
+
+        fused: Dict[Tuple, float] = defaultdict(float)
+        documents: Dict[Tuple, Document] = {}
+        dense_scores: Dict[Tuple, float] = {}
+        for ranking in [dense, sparse]:
+            for rank, (document, _) in enumerate(ranking):
+                key = document_key(document)
+                fused[key] += 1 / (self.rrf_k + rank + 1)
+                documents.setdefault(key, document)
+        for document, score in dense:
+            dense_scores.setdefault(document_key(document), score)
+
+        best = sorted(fused, key=fused.get, reverse=True)[: self.k]
+        return [(documents[key], dense_scores.get(key)) for key in best]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return scored_documents(self.search_with_scores(query))
+
+
+def scored_documents(
+    results: List[Tuple[Document, Optional[float]]],
+) -> List[Document]:
+    """
+    Copies of retrieved documents with their relevance score in the metadata.
+
+    Args:
+        results (list): (document, relevance score or None) pairs
+
+    Returns:
+        list: The documents, scored ones with RELEVANCE_SCORE_KEY set
+    """
+    return [
+        document
+        if score is None
+        else Document(
+            page_content=document.page_content,
+            metadata={**document.metadata, RELEVANCE_SCORE_KEY: score},
+        )
+        for document, score in results
+    ]
+
+
+def relevance_scores(documents: List[Document]) -> List[Optional[float]]:
+    """Relevance scores set by the retriever, None for unscored documents."""
+    return [document.metadata.get(RELEVANCE_SCORE_KEY) for document in documents]
+
+
+def document_key(document: Document) -> Tuple:
+    return document.metadata.get("source"), document.page_content
+
+
+def stored_documents(vectorstore: VectorStore) -> List[Document]:
+    """
+    Every document held by a vector store.
+
+    Args:
+        vectorstore (VectorStore): A NumpyVectorStore or Chroma store
+
+    Returns:
+        list: The stored documents
+    """
+    if hasattr(vectorstore, "documents"):
+        return vectorstore.documents()
+    stored = vectorstore.get(include=["documents", "metadatas"])
+    return [
+        Document(page_content=text, metadata=metadata or {})
+        for text, metadata in zip(stored["documents"], stored["metadatas"])
+    ]
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from collections import Counter
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Literal,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+from langchain_core.vectorstores import VectorStore
+
+Datasource = Literal["vectorstore", "web_search"]
+
+
+class SimilarityPreRouter:
+    """
+    Routes clear-cut questions locally, before the LLM question router.
+
+    A question whose closest indexed chunk is at least `upper` cosine-similar
+    goes to the vectorstore and one below `lower` goes to web search, without an
+    LLM call. Only questions in between fall back to the LLM router. Decisions
+    are counted per path and datasource so the thresholds can be tuned.
+
+    Good thresholds depend on the embedding model and the corpus: ada-002
+    similarities of related and unrelated text both tend to fall between 0.7
+    and 0.9. Derive them from questions with a known datasource with
+    calibrate(), then check the local share of stats() in production.
+    """
+
+    def __init__(self, vectorstore: VectorStore):
+        self.vectorstore = vectorstore
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def route(
+        self,
+        question: str,
+        fallback: Callable[[str], Datasource],
+        thresholds: Tuple[float, float],
+    ) -> Datasource:
+        """
+        Pick the datasource for a question.
+
+        Args:
+            question (str): The user question
+            fallback (callable): Router used when the similarity is inconclusive
+            thresholds (tuple): (lower, upper) cosine similarity bounds
+
+        Returns:
+            str: "vectorstore" or "web_search"
+        """
+        datasource = _route_locally(self.top_similarity(question), thresholds)
+        if datasource is None:
+            return self._count("llm", fallback(question))
+        return self._count("local", datasource)
+
+    async def aroute(
+        self,
+        question: str,
+        fallback: Callable[[str], Awaitable[Datasource]],
+        thresholds: Tuple[float, float],
+    ) -> Datasource:
+        """Async version of route, with an async fallback router."""
+        similarity = await asyncio.to_thread(self.top_similarity, question)
+        datasource = _route_locally(similarity, thresholds)
+        if datasource is None:
+            return self._count("llm", await fallback(question))
+        return self._count("local", datasource)
+
+    def calibrate(
+        self, questions: Mapping[Datasource, Iterable[str]]
+    ) -> Tuple[float, float]:
+        """
+        Thresholds that route the given questions locally only when it is safe.
+
+        Upper is set just above the most similar web search question, and lower
+        at the least similar vectorstore question, so none of the questions is
+        routed to the wrong datasource and those in between go to the LLM.
+
+        Args:
+            questions (dict): Questions known to belong to each datasource,
+                e.g. from the router's past decisions or a labelled sample
+
+        Returns:
+            tuple: (lower, upper), for the pre_routing_thresholds setting
+        """
+        vectorstore = [self.top_similarity(q) for q in questions["vectorstore"]]
+        web_search = [self.top_similarity(q) for q in questions["web_search"]]
+        lower = min(vectorstore)
+        upper = max(web_search) + 1e-6
+        if lower >= upper:
+            # The datasources are separable: decide everything locally.
+            lower = upper = (min(vectorstore) + max(web_search)) / 2
+        return lower, upper
+
+    def _count(self, path: str, datasource: Datasource) -> Datasource:
+        with self._lock:
+            self.counts[f"{path}:{datasource}"] += 1
+        return datasource
+
+    def top_similarity(self, question: str) -> float:
+        # One query embedding; the store's relevance score is the similarity.
+        top = self.vectorstore.similarity_search_with_relevance_scores(question, k=1)
+        if not top:
+            return -1.0
+        return top[0][1]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _route_locally(
+    similarity: float, thresholds: Tuple[float, float]
+) -> Optional[Datasource]:
+    lower, upper = thresholds
+    if similarity >= upper:
+        return "vectorstore"
+    elif similarity < lower:
+        return "web_search"
+    return None
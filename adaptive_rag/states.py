@@ -3,6 +3,9 @@ from typing import List, Optional
 from langchain_core.documents import Document
 from typing_extensions import TypedDict
 
+from adaptive_rag.budget import RunBudget
+from adaptive_rag.packing import PackingStats
+
 
 class GraphState(TypedDict):
     """
@@ -11,9 +14,17 @@ class GraphState(TypedDict):
     Attributes:
         question: question
         generation: LLM generation
+        latest_generation: last generation of the run, even if graded down
         documents: list of documents
+        scores: cosine similarity of each document to the question, None if unknown
+        context_stats: how the context of the last generation was packed
+        budget: limits on the run's LLM calls, tokens and time, None if unlimited
     """
 
     question: str
     documents: List[str | Document]
+    scores: Optional[List[Optional[float]]]
     generation: Optional[str]
+    latest_generation: Optional[str]
+    context_stats: Optional[PackingStats]
+    budget: Optional[RunBudget]
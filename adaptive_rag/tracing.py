@@ -0,0 +1,409 @@
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from typing_extensions import TypedDict
+
+from adaptive_rag.caches import is_cache_hit
+
+# Edge functions and chains traced as steps besides the graph nodes, which are
+# recognised by their run name.
+TRACED_STEPS = frozenset(
+    {
+        # adaptive_rag edges
+        "route_question",
+        "decide_to_generate",
+        "grade_generation_v_documents_and_question",
+        # agentic_rag edges
+        "grade_documents",
+        "tools_condition",
+        # adaptive_rag chains
+        "question_router",
+        "retrieval_grader",
+        "batch_retrieval_grader",
+        "rag_chain",
+        "hallucination_grader",
+        "answer_grader",
+        "question_rewriter",
+    }
+)
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Step that LLM calls made outside of any traced step are attributed to.
+UNTRACED_STEP = "(graph)"
+
+
+class StepStats(TypedDict):
+    """
+    Usage of one node, edge or chain within a run.
+
+    Attributes:
+        calls: times the step ran
+        wall_time: seconds spent in the step, including nested steps
+        self_time: wall_time without the nested steps, e.g. a node without the
+            grading edge that LangGraph runs inside it
+        llm_calls: model calls made directly by the step
+        cache_hits: model calls of the step served from the response cache
+        prompt_tokens: prompt tokens of the uncached model calls
+        completion_tokens: completion tokens of the uncached model calls
+    """
+
+    calls: int
+    wall_time: float
+    self_time: float
+    llm_calls: int
+    cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class RunTrace(TypedDict):
+    """
+    Trace summary of one graph run.
+
+    Attributes:
+        name: run name of the graph
+        wall_time: seconds from start to end of the run
+        path: steps in the order they started, which shows the loops taken
+        steps: usage per step name
+    """
+
+    name: str
+    wall_time: float
+    path: List[str]
+    steps: Dict[str, StepStats]
+
+
+class _OpenStep:
+    def __init__(self, name: str, parent: Optional["_OpenStep"]):
+        self.name = name
+        self.parent = parent
+        self.started_at = time.perf_counter()
+        self.child_time = 0.0
+
+
+class _OpenRun:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.path: List[str] = []
+        self.steps: Dict[str, StepStats] = defaultdict(_empty_step_stats)
+
+
+class GraphTracer(BaseCallbackHandler):
+    """
+    Callback handler recording where the time and tokens of graph runs go.
+
+    Attach it to a graph, e.g. graph.with_config(callbacks=[tracer]), and it
+    traces every node, the edges and chains named in TRACED_STEPS: their wall
+    time, model calls, tokens and response cache hits. Each finished run adds a
+    RunTrace to traces and its step latencies to histograms, which can be
+    exported with to_json and to_prometheus. Works for any LangGraph graph, so
+    for both the adaptive and the agentic RAG graph.
+    """
+
+    # Time on the calling thread, not on the callback executor.
+    run_inline = True
+
+    def __init__(
+        self,
+        steps: FrozenSet[str] = TRACED_STEPS,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        max_traces: int = 1000,
+    ):
+        self.step_names = steps
+        self.buckets = buckets
+        self.traces: deque = deque(maxlen=max_traces)
+        # Per step name: bucket counts (last one is +Inf), sum and count.
+        self.histograms: Dict[str, Dict[str, Any]] = {}
+        self.run_histogram = self._empty_histogram()
+        self.totals: Dict[str, StepStats] = defaultdict(_empty_step_stats)
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._steps: Dict[UUID, _OpenStep] = {}
+        self._runs: Dict[UUID, _OpenRun] = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "graph"
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            if parent_run_id is None:
+                self._runs[run_id] = _OpenRun(name)
+                return
+            is_node = name == (metadata or {}).get("langgraph_node")
+            if not is_node and name not in self.step_names:
+                return
+            parent = self._enclosing_step(parent_run_id)
+            # A node implemented by a runnable of the same name is one step.
+            if parent is not None and parent.name == name:
+                return
+            self._steps[run_id] = _OpenStep(name, parent)
+            run = self._runs.get(self._root(run_id))
+            if run is not None:
+                run.path.append(name)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chat_model_start(
+        self,
+        serialized,
+        messages,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def on_llm_start(
+        self,
+        serialized,
+        prompts,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        cache_hit = is_cache_hit(response)
+        prompt_tokens, completion_tokens = token_usage(response)
+        if cache_hit:
+            prompt_tokens = completion_tokens = 0
+        with self._lock:
+            step = self._enclosing_step(run_id)
+            name = step.name if step is not None else UNTRACED_STEP
+            for stats in self._stats_of(run_id, name):
+                stats["llm_calls"] += 1
+                stats["cache_hits"] += cache_hit
+                stats["prompt_tokens"] += prompt_tokens
+                stats["completion_tokens"] += completion_tokens
+
+    def on_tool_start(
+        self,
+        serialized,
+        input_str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def on_retriever_start(
+        self,
+        serialized,
+        query,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def last_trace(self) -> Optional[RunTrace]:
+        with self._lock:
+            return self.traces[-1] if self.traces else None
+
+    def to_json(self, **kwargs) -> str:
+        """
+        Run traces, per-step totals and latency histograms as JSON.
+
+        Args:
+            **kwargs: Passed to json.dumps, e.g. indent
+
+        Returns:
+            str: The JSON document
+        """
+        with self._lock:
+            return json.dumps(
+                {
+                    "runs": list(self.traces),
+                    "totals": dict(self.totals),
+                    "histograms": {
+                        "buckets": list(self.buckets),
+                        "runs": self.run_histogram,
+                        "steps": self.histograms,
+                    },
+                },
+                ensure_ascii=False,
+                **kwargs,
+            )
+
+    def to_prometheus(self, prefix: str = "rag") -> str:
+        """
+        Latency histograms and usage counters in the Prometheus text format.
+
+        Args:
+            prefix (str): Prefix of the metric names
+
+        Returns:
+            str: The exposition text
+        """
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_run_duration_seconds Wall time of graph runs.",
+                f"# TYPE {prefix}_run_duration_seconds histogram",
+            ]
+            lines += self._histogram_lines(
+                f"{prefix}_run_duration_seconds", "", self.run_histogram
+            )
+            lines += [
+                f"# HELP {prefix}_step_duration_seconds "
+                "Wall time of graph nodes, edges and chains.",
+                f"# TYPE {prefix}_step_duration_seconds histogram",
+            ]
+            for name, histogram in sorted(self.histograms.items()):
+                lines += self._histogram_lines(
+                    f"{prefix}_step_duration_seconds",
+                    f'step="{_escape(name)}",',
+                    histogram,
+                )
+            counters = [
+                ("llm_calls", "Model calls made by each step."),
+                ("cache_hits", "Model calls served from the response cache."),
+                ("prompt_tokens", "Prompt tokens of uncached model calls."),
+                ("completion_tokens", "Completion tokens of uncached model calls."),
+            ]
+            for key, description in counters:
+                metric = f"{prefix}_step_{key}_total"
+                lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+                for name, stats in sorted(self.totals.items()):
+                    lines.append(f'{metric}{{step="{_escape(name)}"}} {stats[key]}')
+            return "\n".join(lines) + "\n"
+
+    def _end(self, run_id: UUID):
+        now = time.perf_counter()
+        with self._lock:
+            step = self._steps.pop(run_id, None)
+            if step is not None:
+                elapsed = now - step.started_at
+                if step.parent is not None:
+                    step.parent.child_time += elapsed
+                for stats in self._stats_of(run_id, step.name):
+                    stats["calls"] += 1
+                    stats["wall_time"] += elapsed
+                    stats["self_time"] += elapsed - step.child_time
+                self._observe(
+                    self.histograms.setdefault(step.name, self._empty_histogram()),
+                    elapsed,
+                )
+
+            run = self._runs.pop(run_id, None)
+            if run is not None:
+                elapsed = now - run.started_at
+                self._observe(self.run_histogram, elapsed)
+                self.traces.append(
+                    RunTrace(
+                        name=run.name,
+                        wall_time=elapsed,
+                        path=run.path,
+                        steps=dict(run.steps),
+                    )
+                )
+                self._forget_run(run_id)
+
+    def _stats_of(self, run_id: UUID, name: str) -> List[StepStats]:
+        # Usage of a step counts towards its run and the totals over all runs.
+        run = self._runs.get(self._root(run_id))
+        if run is None:
+            return [self.totals[name]]
+        return [run.steps[name], self.totals[name]]
+
+    def _root(self, run_id: UUID) -> UUID:
+        while self._parents.get(run_id) is not None:
+            run_id = self._parents[run_id]
+        return run_id
+
+    def _enclosing_step(self, run_id: Optional[UUID]) -> Optional[_OpenStep]:
+        while run_id is not None:
+            if run_id in self._steps:
+                return self._steps[run_id]
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _forget_run(self, root_id: UUID):
+        # Runs stay in the parent map until their graph run ends, so that
+        # late callbacks of their children can still be attributed.
+        finished = [
+            run_id for run_id in self._parents if self._root(run_id) == root_id
+        ]
+        for run_id in finished:
+            del self._parents[run_id]
+
+    def _empty_histogram(self) -> Dict[str, Any]:
+        return {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+
+    def _observe(self, histogram: Dict[str, Any], value: float):
+        histogram["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def _histogram_lines(
+        self, metric: str, labels: str, histogram: Dict[str, Any]
+    ) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], histogram["counts"]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{metric}_sum{labels} {histogram['sum']}")
+        lines.append(f"{metric}_count{labels} {histogram['count']}")
+        return lines
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int]:
+    """Prompt and completion tokens of a model response."""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if prompt_tokens or completion_tokens:
+        return prompt_tokens, completion_tokens
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def _empty_step_stats() -> StepStats:
+    return StepStats(
+        calls=0,
+        wall_time=0.0,
+        self_time=0.0,
+        llm_calls=0,
+        cache_hits=0,
+        prompt_tokens=0,
+        completion_tokens=0,
+    )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+DOCUMENTS_FILENAME = "documents.jsonl"
+QUANTIZED_DTYPES = ["float16", "int8"]
+# Rows converted to float32 at a time when scoring quantized vectors.
+SCORING_BLOCK_SIZE = 4096
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store backed by one contiguous float32 matrix.
+
+    Embeddings are normalized on insert, so a search is a single matrix-vector
+    product followed by an argpartition top-k. With a persist directory the
+    matrix is saved as an .npy file and memory-mapped on load, so opening a
+    large index only maps the file and pages are read in as searches touch them.
+    Scores are cosine similarities.
+
+    With dtype "float16" or "int8" (with one scale per vector), searches run on
+    a quantized copy of the matrix. The top `rescore_candidates` are then
+    optionally re-scored against the full-precision vectors, which stay on disk
+    when the store is persisted.
+
+    Adds and deletes only change the in-memory index. They are written to the
+    persist directory by persist(), so a bulk load writes the files once.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        persist_directory: Optional[str] = None,
+        dtype: str = "float32",
+        rescore_candidates: int = 0,
+    ):
+        if dtype != "float32" and dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self._embedding = embedding
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        self.rescore_candidates = rescore_candidates
+        self._ids: List[str] = []
+        self._documents: List[Document] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._quantized: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        if persist_directory and os.path.exists(
+            os.path.join(persist_directory, EMBEDDINGS_FILENAME)
+        ):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize(
+            np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        )
+
+        with self._lock:
+            # Same id means same chunk: replace it, like Chroma's upsert.
+            self._remove(set(ids))
+            documents = [
+                Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(texts, metadatas)
+            ]
+            self._ids.extend(ids)
+            self._documents.extend(documents)
+            if self._keeps_full_precision():
+                self._matrix = _append_rows(self._matrix, vectors)
+            if self.dtype != "float32":
+                quantized, scales = quantize(vectors, self.dtype)
+                self._quantized = _append_rows(self._quantized, quantized)
+                self._scales = _append_rows(self._scales, scales)
+            self._dirty = True
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            if ids is None:
+                self._ids, self._documents = [], []
+                self._matrix = self._quantized = self._scales = None
+            else:
+                self._remove(set(ids))
+            self._dirty = True
+        return True
+
+    def persist(self):
+        """Write the changes made since the last call to the persist directory."""
+        with self._lock:
+            if self.persist_directory and self._dirty:
+                self._save()
+            self._dirty = False
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        with self._lock:
+            positions = {id_: position for position, id_ in enumerate(self._ids)}
+            return [
+                self._documents[positions[id_]] for id_ in ids if id_ in positions
+            ]
+
+    def documents(self) -> List[Document]:
+        """Every stored document, in insertion order."""
+        with self._lock:
+            return list(self._documents)
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score(query, k, **kwargs)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            if not self._ids:
+                return []
+            if self.dtype == "float32":
+                scores = self._matrix @ query
+                top = top_k_indices(scores, k)
+                return [(self._documents[i], float(scores[i])) for i in top]
+
+            scores = quantized_scores(self._quantized, self._scales, query)
+            top = top_k_indices(scores, max(k, self.rescore_candidates))
+            if self.rescore_candidates and self._matrix is not None:
+                # Reading the candidate rows in file order keeps memory-mapped
+                # access sequential and leaves the other rows on disk.
+                candidates = np.sort(top)
+                exact = self._matrix[candidates] @ query
+                order = np.argsort(-exact)[:k]
+                top, scores = candidates[order], exact[order]
+            else:
+                top = top[:k]
+                scores = scores[top]
+            return [
+                (self._documents[i], float(score)) for i, score in zip(top, scores)
+            ]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Relevance is the cosine similarity itself, as for a Chroma collection
+        # in cosine space, so similarity thresholds mean the same on both.
+        # Quantization error can push it slightly past 1.
+        return lambda score: min(max(score, 0.0), 1.0)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        vectorstore = cls(embedding, persist_directory=persist_directory, **kwargs)
+        vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+        vectorstore.persist()
+        return vectorstore
+
+    def _keeps_full_precision(self) -> bool:
+        # Persisted stores always write float32 to disk, where it costs no
+        # resident memory until it is read for re-scoring.
+        return (
+            self.dtype == "float32"
+            or bool(self.persist_directory)
+            or bool(self.rescore_candidates)
+        )
+
+    def _remove(self, ids: set):
+        keep = [position for position, id_ in enumerate(self._ids) if id_ not in ids]
+        if len(keep) == len(self._ids):
+            return
+        self._ids = [self._ids[position] for position in keep]
+        self._documents = [self._documents[position] for position in keep]
+        for name in ["_matrix", "_quantized", "_scales"]:
+            array = getattr(self, name)
+            if array is not None:
+                setattr(self, name, array[keep] if keep else None)
+
+    def _quantized_paths(self) -> Tuple[str, str]:
+        return (
+            os.path.join(self.persist_directory, f"quantized-{self.dtype}.npy"),
+            os.path.join(self.persist_directory, f"scales-{self.dtype}.npy"),
+        )
+
+    def _save(self):
+        if not self.persist_directory:
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        arrays = {EMBEDDINGS_FILENAME: self._matrix}
+        if self.dtype != "float32":
+            quantized_path, scales_path = self._quantized_paths()
+            arrays[os.path.basename(quantized_path)] = self._quantized
+            arrays[os.path.basename(scales_path)] = self._scales
+        for filename, array in arrays.items():
+            path = os.path.join(self.persist_directory, filename)
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, array if array is not None else np.zeros(0, np.float32))
+
+        documents_path = os.path.join(self.persist_directory, DOCUMENTS_FILENAME)
+        with open(f"{documents_path}.tmp", "w") as f:
+            for id_, document in zip(self._ids, self._documents):
+                record = {
+                    "id": id_,
+                    "page_content": document.page_content,
+                    "metadata": document.metadata,
+                }
+                f.write(json.dumps(record, default=str) + "\n")
+
+        for filename in arrays:
+            path = os.path.join(self.persist_directory, filename)
+            os.replace(f"{path}.tmp", path)
+        os.replace(f"{documents_path}.tmp", documents_path)
+        # Quantized copies in other dtypes no longer match the documents.
+        for dtype in QUANTIZED_DTYPES:
+            if dtype != self.dtype:
+                for prefix in ["quantized", "scales"]:
+                    path = os.path.join(self.persist_directory, f"{prefix}-{dtype}.npy")
+                    if os.path.exists(path):
+                        os.remove(path)
+        # Swap the freshly written arrays back in as memory maps, so the
+        # in-memory copies built by the update can be released.
+        self._load_arrays()
+
+    def _load(self):
+        with open(os.path.join(self.persist_directory, DOCUMENTS_FILENAME)) as f:
+            records = [json.loads(line) for line in f]
+        self._ids = [record["id"] for record in records]
+        self._documents = [
+            Document(page_content=record["page_content"], metadata=record["metadata"])
+            for record in records
+        ]
+        if self.dtype != "float32" and not os.path.exists(self._quantized_paths()[0]):
+            # First open in this dtype: quantize the stored vectors once.
+            matrix = np.load(
+                os.path.join(self.persist_directory, EMBEDDINGS_FILENAME), mmap_mode="r"
+            )
+            self._matrix = matrix if len(matrix) else None
+            if self._matrix is not None:
+                self._quantized, self._scales = quantize(self._matrix, self.dtype)
+            self._save()
+        self._load_arrays()
+
+    def _load_arrays(self):
+        if not self._ids:
+            self._matrix = self._quantized = self._scales = None
+            return
+        self._matrix = np.load(
+            os.path.join(self.persist_directory, EMBEDDINGS_FILENAME), mmap_mode="r"
+        )
+        if self.dtype != "float32":
+            quantized_path, scales_path = self._quantized_paths()
+            self._quantized = np.load(quantized_path, mmap_mode="r")
+            scales = np.load(scales_path, mmap_mode="r")
+            self._scales = scales if len(scales) else None
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors, a single one or the rows of a matrix, to unit length."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def quantize(
+    vectors: np.ndarray, dtype: str
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Quantize float32 vectors.
+
+    Args:
+        vectors (np.ndarray): Matrix of float32 vectors, one per row
+        dtype (str): "float16", or "int8" with a symmetric scale per vector
+
+    Returns:
+        tuple: Quantized matrix, and the per-vector scales for int8 (else None)
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    elif dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales
+    else:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+
+def quantized_scores(
+    quantized: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray
+) -> np.ndarray:
+    """
+    Approximate dot products of a float32 query with quantized vectors.
+
+    Rows are converted to float32 a block at a time, so scoring never holds a
+    full-precision copy of the matrix.
+    """
+    scores = np.empty(len(quantized), dtype=np.float32)
+    for start in range(0, len(quantized), SCORING_BLOCK_SIZE):
+        block = np.asarray(quantized[start : start + SCORING_BLOCK_SIZE], np.float32)
+        scores[start : start + len(block)] = block @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def _append_rows(array: Optional[np.ndarray], rows: Optional[np.ndarray]):
+    if rows is None:
+        return None
+    if array is None or not len(array):
+        return rows
+    return np.concatenate([array, rows])
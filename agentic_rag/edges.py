@@ -1,12 +1,34 @@
 from typing import Literal
 
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
+from agentic_rag.utils import get_chat_model, get_or_build
 from tutorial.utils import State
 
 
+class Grade(BaseModel):
+    binary_score: str = Field(description="Relevance score 'yse' or 'no'")
+
+
+GRADE_PROMPT = PromptTemplate(
+    template="""You are a grader assessing relevance of a retrieved document to a user question. \n 
+    Here is the retrieved document: \n\n {context} \n\n
+    Here is the user question: {question} \n
+    If the document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n
+    Give a binary score 'yes' or 'no' score to indicate whether the document is relevant to the question.""",
+    input_variables=["context", "question"],
+)
+
+
+def get_grade_chain():
+    """Relevance grading chain of the grade_documents edge, built once per process."""
+    return get_or_build(
+        "grade_chain",
+        lambda: GRADE_PROMPT | get_chat_model().with_structured_output(Grade),
+    )
+
+
 def grade_documents(state: State) -> Literal["generate", "rewrite"]:
     """
     Determines whether the retrieved documents are relevant to the question.
@@ -18,29 +40,11 @@ def grade_documents(state: State) -> Literal["generate", "rewrite"]:
         str: A decision for whether the documents are relevant or not
     """
 
-    class Grade(BaseModel):
-        binary_score: str = Field(description="Relevance score 'yse' or 'no'")
-
-    model = ChatOpenAI(temperature=0, streaming=True, model="gpt-3.5-turbo")
-
-    llm_with_tool = model.with_structured_output(Grade)
-
-    prompt = PromptTemplate(
-        template="""You are a grader assessing relevance of a retrieved document to a user question. \n 
-        Here is the retrieved document: \n\n {context} \n\n
-        Here is the user question: {question} \n
-        If the document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n
-        Give a binary score 'yes' or 'no' score to indicate whether the document is relevant to the question.""",
-        input_variables=["context", "question"],
-    )
-
-    chain = prompt | llm_with_tool
-
     messages = state["messages"]
     last_message = messages[-1]
     question = messages[0].content
     docs = last_message.content
-    scored_result = chain.invoke({"question": question, "context": docs})
+    scored_result = get_grade_chain().invoke({"question": question, "context": docs})
     score = scored_result.binary_score
     if score == "yes":
         return "generate"
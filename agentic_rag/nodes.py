@@ -1,12 +1,31 @@
-from langchain import hub
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
 
-from agentic_rag.utils import get_retriever_tools
+from agentic_rag.utils import (
+    get_chat_model,
+    get_or_build,
+    get_rag_prompt,
+    get_retriever_tools,
+)
 from tutorial.utils import State
 
 
+def get_agent_model():
+    """Chat model bound to the retriever tools, built once per process."""
+
+    def build():
+        return get_chat_model().bind_tools(get_retriever_tools())
+
+    return get_or_build("agent_model", build)
+
+
+def get_rag_chain():
+    """RAG chain of the generate step, built once per process."""
+    return get_or_build(
+        "rag_chain", lambda: get_rag_prompt() | get_chat_model() | StrOutputParser()
+    )
+
+
 def agent(state: State):
     """
     Invokes the agent model to generate a response based on the current state. Given
@@ -19,9 +38,7 @@ def agent(state: State):
         dict: The updated state with the agent response appended to messages
     """
     messages = state["messages"]
-    model = ChatOpenAI(temperature=0, streaming=True, model="gpt-3.5-turbo")
-    model = model.bind_tools(get_retriever_tools())
-    response = model.invoke(messages)
+    response = get_agent_model().invoke(messages)
     return {"messages": [response]}
 
 
@@ -50,8 +67,7 @@ def rewrite(state: State):
         )
     ]
 
-    model = ChatOpenAI(temperature=0, streaming=True, model="gpt-3.5-turbo")
-    response = model.invoke(msg)
+    response = get_chat_model().invoke(msg)
     return {"messages": [response]}
 
 
@@ -71,13 +87,5 @@ def generate(state: State):
 
     docs = last_messages.content
 
-    prompt = hub.pull("rlm/rag-prompt")
-    model = ChatOpenAI(temperature=0, streaming=True, model="gpt-3.5-turbo")
-
-    def format_docs(docs):
-        return "\n\n".join(doc.page_contents for doc in docs)
-
-    rag_chain = prompt | model | StrOutputParser()
-
-    response = rag_chain.invoke({"context": docs, "question": question})
+    response = get_rag_chain().invoke({"context": docs, "question": question})
     return {"messages": [response]}
@@ -1,39 +1,155 @@
-from typing import TypedDict, Annotated, Sequence
+import os
+import threading
+from typing import TypedDict, Annotated, Sequence, Callable, Any, Dict, Tuple
 
-from langchain_community.document_loaders import WebBaseLoader
+import httpx
 from langchain_community.vectorstores import Chroma
 from langchain_core.messages import BaseMessage
 from langchain_core.tools import create_retriever_tool
-from langchain_openai import OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph.graph.message import add_messages
 from langgraph.graph.state import CompiledStateGraph
 
+from common.embeddings import get_cached_embeddings
+from common.loaders import load_split_web_documents
+from common.prompts import RAG_PROMPT_NAME, get_prompt
+
+
+_registry: Dict[str, Any] = {}
+# Re-entrant so a factory can fetch the objects it depends on from the registry.
+_registry_lock = threading.RLock()
+
+
+def get_or_build(key: str, factory: Callable[[], Any]) -> Any:
+    """
+    Return the process-wide object registered under key, building it once.
+
+    Args:
+        key (str): Registry key
+        factory (callable): Builds the object on first request
+
+    Returns:
+        Any: The shared object
+    """
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = factory()
+        return _registry[key]
+
+
+def register(key: str, value: Any):
+    """
+    Register an object under key, e.g. a stand-in model for a benchmark.
+
+    Args:
+        key (str): Registry key
+        value (Any): Object returned by the next requests for key
+    """
+    with _registry_lock:
+        _registry[key] = value
+
+
+def clear_registry():
+    """Drop every shared object so the next request rebuilds it."""
+    with _registry_lock:
+        _registry.clear()
+
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    HTTP connection pools shared by every chat model client, built once per process.
+
+    Connections are kept alive between calls, so a hot agent loop skips the TCP
+    and TLS handshakes. The pool is sized by environment variables:
+    AGENTIC_RAG_HTTP_MAX_CONNECTIONS (default 100),
+    AGENTIC_RAG_HTTP_MAX_KEEPALIVE_CONNECTIONS (default 20) and
+    AGENTIC_RAG_HTTP_KEEPALIVE_EXPIRY in seconds (default 60).
+
+    Returns:
+        tuple: The sync and the async client
+    """
+
+    def build():
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("AGENTIC_RAG_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(
+                os.getenv("AGENTIC_RAG_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+            ),
+            keepalive_expiry=float(
+                os.getenv("AGENTIC_RAG_HTTP_KEEPALIVE_EXPIRY", "60")
+            ),
+        )
+        timeout = httpx.Timeout(60.0, connect=5.0)
+        return (
+            httpx.Client(limits=limits, timeout=timeout),
+            httpx.AsyncClient(limits=limits, timeout=timeout),
+        )
+
+    return get_or_build("http_clients", build)
+
+
+def get_chat_model():
+    """Chat model of the agent, rewrite, generate and grading steps."""
+
+    def build():
+        http_client, http_async_client = get_http_clients()
+        return ChatOpenAI(
+            temperature=0,
+            streaming=True,
+            model="gpt-3.5-turbo",
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+
+    return get_or_build("chat_model", build)
+
+
+def get_rag_prompt():
+    """RAG prompt of the generate step, from the shared prompt registry."""
+    return get_or_build("rag_prompt", lambda: get_prompt(RAG_PROMPT_NAME))
+
+
+def get_embeddings():
+    """Embeddings of the corpus, with the cache shared with adaptive_rag."""
+    return get_or_build("embeddings", get_cached_embeddings)
+
+
+def get_retriever():
+    """Retriever over the blog corpus, built once per process."""
+    return get_or_build("retriever", _build_retriever)
+
 
 def get_retriever_tools():
+    """Retriever tools over the blog corpus, built once per process."""
+    return get_or_build("retriever_tools", _build_retriever_tools)
+
+
+def _build_retriever():
     urls = [
         "https://lilianweng.github.io/posts/2023-06-23-agent/",
         "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
         "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
     ]
 
-    docs = [WebBaseLoader(url).load() for url in urls]
-    docs_list = [item for sublist in docs for item in sublist]
-
     text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=100, chunk_overlap=50
     )
 
-    doc_splits = text_splitter.split_documents(docs_list)
+    doc_splits = load_split_web_documents(urls, text_splitter)
 
     vectorstore = Chroma.from_documents(
-        documents=doc_splits, collection_name="rag-chroma", embedding=OpenAIEmbeddings()
+        documents=doc_splits,
+        collection_name="rag-chroma",
+        embedding=get_embeddings(),
     )
 
-    retriever = vectorstore.as_retriever()
+    return vectorstore.as_retriever()
+
 
+def _build_retriever_tools():
     retriever_tool = create_retriever_tool(
-        retriever,
+        get_retriever(),
         "retrieve_blog_posts",
         "Search and return information about Lilian Weng blog posts on LLM agents, prompt engineering, and adversarial attacks on LLMs.",
     )
@@ -0,0 +1,453 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional
+
+import numpy as np
+from langchain import hub
+from langchain_community.tools import TavilySearchResults
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from typing_extensions import TypedDict
+
+# Set while a live call is being recorded, so the calls it makes internally,
+# e.g. ChatOpenAI._generate streaming through _stream, are not recorded twice.
+_recording: ContextVar[bool] = ContextVar("cassette_recording", default=False)
+
+
+class CassetteMiss(KeyError):
+    """A replayed run made a call that was not recorded."""
+
+
+class CassetteRecord(TypedDict):
+    """
+    One recorded call, a line of the cassette file.
+
+    Attributes:
+        kind: "chat", "embed", "search" or "hub"
+        key: hash of the request
+        latency: seconds the live call took
+        response: the response in a JSON-compatible form
+    """
+
+    kind: str
+    key: str
+    latency: float
+    response: Any
+
+
+class Cassette:
+    """
+    Records or replays every OpenAI, Tavily and LangChain hub call of a block.
+
+    In "record" mode the calls go to the live services and are written to a
+    gzipped JSON lines file when the block ends; embedding vectors are stored
+    as base64 float32. In "replay" mode the same calls are answered from the
+    file, with the recorded latency or none at all, and a call that was not
+    recorded raises CassetteMiss. Requests are matched by their content, so
+    identical requests are served their recorded responses in order.
+
+    Chat models are intercepted where they call the API, behind the response
+    cache of adaptive_rag, so cache lookups and their statistics work the
+    same in both modes.
+
+    Example:
+        with Cassette("traces/questions.cassette", mode="record"):
+            get_answer_for(question, graph)
+        with Cassette("traces/questions.cassette", mode="replay", latency="none"):
+            get_answer_for(question, graph)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: Literal["record", "replay"] = "replay",
+        latency: Literal["original", "none"] = "original",
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.records: List[CassetteRecord] = []
+        self._responses: Dict[str, List[CassetteRecord]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+        self._originals: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Cassette":
+        if self.mode == "replay":
+            self._load()
+        self._patch(ChatOpenAI, "_generate", self._wrap_chat)
+        self._patch(ChatOpenAI, "_agenerate", self._wrap_achat)
+        self._patch(ChatOpenAI, "_stream", self._wrap_stream)
+        self._patch(ChatOpenAI, "_astream", self._wrap_astream)
+        for name in ["embed_documents", "embed_query"]:
+            self._patch(OpenAIEmbeddings, name, self._wrap_embed)
+        for name in ["aembed_documents", "aembed_query"]:
+            self._patch(OpenAIEmbeddings, name, self._wrap_aembed)
+        self._patch(TavilySearchResults, "_run", self._wrap_search)
+        self._patch(TavilySearchResults, "_arun", self._wrap_asearch)
+        self._patch(hub, "pull", self._wrap_hub)
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, original in reversed(self._originals):
+            if original is None:
+                # The attribute was inherited; uncover it again.
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._originals.clear()
+        if self.mode == "record":
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.records.append(record)
+                self._responses[f"{record['kind']}:{record['key']}"].append(record)
+
+    def _patch(self, owner, name: str, make_wrapper: Callable):
+        self._originals.append((owner, name, vars(owner).get(name)))
+        setattr(owner, name, make_wrapper(getattr(owner, name)))
+
+    def _record(self, kind: str, key: str, latency: float, response: Any):
+        with self._lock:
+            self.records.append(
+                CassetteRecord(kind=kind, key=key, latency=latency, response=response)
+            )
+
+    def _replay(self, kind: str, key: str) -> CassetteRecord:
+        with self._lock:
+            recorded = self._responses.get(f"{kind}:{key}")
+            if not recorded:
+                raise CassetteMiss(f"No recorded {kind} call with key {key}")
+            index = self._served[f"{kind}:{key}"]
+            self._served[f"{kind}:{key}"] += 1
+            # Once the recorded responses run out, keep serving the last one.
+            return recorded[min(index, len(recorded) - 1)]
+
+    def _wait(self, record: CassetteRecord):
+        if self.latency == "original":
+            time.sleep(record["latency"])
+
+    async def _await(self, record: CassetteRecord):
+        if self.latency == "original":
+            await asyncio.sleep(record["latency"])
+
+    def _intercept(self, kind, key, call, encode, decode):
+        if self.mode == "replay":
+            record = self._replay(kind, key)
+            self._wait(record)
+            return decode(record["response"])
+        if _recording.get():
+            return call()
+        token = _recording.set(True)
+        try:
+            start = time.perf_counter()
+            result = call()
+        finally:
+            _recording.reset(token)
+        self._record(kind, key, time.perf_counter() - start, encode(result))
+        return result
+
+    async def _aintercept(self, kind, key, acall, encode, decode):
+        if self.mode == "replay":
+            record = self._replay(kind, key)
+            await self._await(record)
+            return decode(record["response"])
+        if _recording.get():
+            return await acall()
+        token = _recording.set(True)
+        try:
+            start = time.perf_counter()
+            result = await acall()
+        finally:
+            _recording.reset(token)
+        self._record(kind, key, time.perf_counter() - start, encode(result))
+        return result
+
+    def _wrap_chat(self, original):
+        cassette = self
+
+        def _generate(model, messages, stop=None, run_manager=None, **kw):
+            return cassette._intercept(
+                "chat",
+                _chat_key(model, messages, stop, kw),
+                lambda: original(model, messages, stop, run_manager, **kw),
+                _encode_chat_result,
+                _decode_chat_result,
+            )
+
+        return _generate
+
+    def _wrap_achat(self, original):
+        cassette = self
+
+        async def _agenerate(model, messages, stop=None, run_manager=None, **kw):
+            return await cassette._aintercept(
+                "chat",
+                _chat_key(model, messages, stop, kw),
+                lambda: original(model, messages, stop, run_manager, **kw),
+                _encode_chat_result,
+                _decode_chat_result,
+            )
+
+        return _agenerate
+
+    def _wrap_stream(self, original):
+        # Streamed calls are stored like generated ones, as the merged result,
+        # and replayed as a single chunk.
+        cassette = self
+
+        def _stream(model, messages, stop=None, run_manager=None, **kw):
+            key = _chat_key(model, messages, stop, kw)
+            if cassette.mode == "replay":
+                record = cassette._replay("chat", key)
+                cassette._wait(record)
+                yield from _result_chunks(_decode_chat_result(record["response"]))
+                return
+            chunks = original(model, messages, stop, run_manager, **kw)
+            if _recording.get():
+                yield from chunks
+                return
+            start = time.perf_counter()
+            received = []
+            for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+            cassette._record(
+                "chat",
+                key,
+                time.perf_counter() - start,
+                _encode_chat_result(generate_from_stream(iter(received))),
+            )
+
+        return _stream
+
+    def _wrap_astream(self, original):
+        cassette = self
+
+        async def _astream(model, messages, stop=None, run_manager=None, **kw):
+            key = _chat_key(model, messages, stop, kw)
+            if cassette.mode == "replay":
+                record = cassette._replay("chat", key)
+                await cassette._await(record)
+                for chunk in _result_chunks(_decode_chat_result(record["response"])):
+                    yield chunk
+                return
+            chunks = original(model, messages, stop, run_manager, **kw)
+            if _recording.get():
+                async for chunk in chunks:
+                    yield chunk
+                return
+            start = time.perf_counter()
+            received = []
+            async for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+            cassette._record(
+                "chat",
+                key,
+                time.perf_counter() - start,
+                _encode_chat_result(generate_from_stream(iter(received))),
+            )
+
+        return _astream
+
+    def _wrap_embed(self, original):
+        cassette = self
+
+        def embed(embeddings, texts, *args, **kwargs):
+            return cassette._intercept(
+                "embed",
+                _key(original.__name__, embeddings.model, texts),
+                lambda: original(embeddings, texts, *args, **kwargs),
+                _encode_vectors,
+                _decode_vectors,
+            )
+
+        embed.__name__ = original.__name__
+        return embed
+
+    def _wrap_aembed(self, original):
+        cassette = self
+
+        async def aembed(embeddings, texts, *args, **kwargs):
+            return await cassette._aintercept(
+                "embed",
+                _key(original.__name__[1:], embeddings.model, texts),
+                lambda: original(embeddings, texts, *args, **kwargs),
+                _encode_vectors,
+                _decode_vectors,
+            )
+
+        aembed.__name__ = original.__name__
+        return aembed
+
+    def _wrap_search(self, original):
+        cassette = self
+
+        def _run(tool, query, *args, **kwargs):
+            return cassette._intercept(
+                "search",
+                _key(tool.max_results, query),
+                lambda: original(tool, query, *args, **kwargs),
+                _encode_search,
+                _decode_search,
+            )
+
+        return _run
+
+    def _wrap_asearch(self, original):
+        cassette = self
+
+        async def _arun(tool, query, *args, **kwargs):
+            return await cassette._aintercept(
+                "search",
+                _key(tool.max_results, query),
+                lambda: original(tool, query, *args, **kwargs),
+                _encode_search,
+                _decode_search,
+            )
+
+        return _arun
+
+    def _wrap_hub(self, original):
+        cassette = self
+
+        def pull(owner_repo_commit: str, **kwargs):
+            return cassette._intercept(
+                "hub",
+                _key(owner_repo_commit, kwargs),
+                lambda: original(owner_repo_commit, **kwargs),
+                dumps,
+                loads,
+            )
+
+        return pull
+
+
+def _key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _chat_key(
+    model: ChatOpenAI,
+    messages: List[BaseMessage],
+    stop: Optional[List[str]],
+    kwargs: Dict[str, Any],
+) -> str:
+    # Message and tool call ids differ between runs, so only content is matched.
+    normalized = [
+        {
+            "type": message.type,
+            "content": message.content,
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"]}
+                for call in getattr(message, "tool_calls", None) or []
+            ],
+        }
+        for message in messages
+    ]
+    return _key(model.model_name, model.temperature, normalized, stop, kwargs)
+
+
+def _encode_chat_result(result: ChatResult) -> Dict[str, Any]:
+    return {
+        "generations": [
+            {
+                "message": dumps(generation.message),
+                "generation_info": generation.generation_info,
+            }
+            for generation in result.generations
+        ],
+        "llm_output": result.llm_output,
+    }
+
+
+def _decode_chat_result(response: Dict[str, Any]) -> ChatResult:
+    return ChatResult(
+        generations=[
+            ChatGeneration(
+                message=loads(generation["message"]),
+                generation_info=generation["generation_info"],
+            )
+            for generation in response["generations"]
+        ],
+        llm_output=response["llm_output"],
+    )
+
+
+def _result_chunks(result: ChatResult) -> Iterator[ChatGenerationChunk]:
+    for generation in result.generations:
+        message = generation.message
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=message.content,
+                additional_kwargs=message.additional_kwargs,
+                response_metadata=message.response_metadata,
+                usage_metadata=getattr(message, "usage_metadata", None),
+                id=message.id,
+                tool_call_chunks=[
+                    tool_call_chunk(
+                        name=call["name"],
+                        args=json.dumps(call["args"]),
+                        id=call["id"],
+                        index=index,
+                    )
+                    for index, call in enumerate(
+                        getattr(message, "tool_calls", None) or []
+                    )
+                ],
+            ),
+            generation_info=generation.generation_info,
+        )
+
+
+def _encode_vectors(vectors) -> Dict[str, Any]:
+    array = np.asarray(vectors, dtype=np.float32)
+    return {
+        "shape": list(array.shape),
+        "data": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+
+
+def _decode_vectors(response: Dict[str, Any]):
+    array = np.frombuffer(base64.b64decode(response["data"]), dtype=np.float32)
+    return array.reshape(response["shape"]).tolist()
+
+
+def _encode_search(result) -> Dict[str, Any]:
+    # TavilySearchResults returns (content, artifact) pairs.
+    if isinstance(result, tuple):
+        return {"tuple": True, "value": list(result)}
+    return {"tuple": False, "value": result}
+
+
+def _decode_search(response: Dict[str, Any]):
+    return tuple(response["value"]) if response["tuple"] else response["value"]
@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import re
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForToolRun,
+    CallbackManagerForToolRun,
+)
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+# Values returned for structured output, per schema class name. A list is
+# cycled through call by call, e.g. ["no", "yes"] fails every other grade.
+DEFAULT_SCRIPT: Dict[str, Any] = {
+    "RouteQuery": "vectorstore",
+    "GradeDocuments": "yes",
+    "GradeDocumentsBatch": "yes",
+    "GradeHallucinations": "yes",
+    "GradeAnswer": "yes",
+    "Grade": "yes",
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model stand-in with a fixed latency and scripted answers.
+
+    Structured output returns the scripted value of the schema, so the graders
+    and router take the paths given by the script. With tools bound, the model
+    calls the first tool until it sees a tool result, like an agent that
+    retrieves once and then answers. Every answer reports token usage from the
+    length of the messages, roughly four characters per token. Answers are
+    streamed word by word when a run streams; tool calls are not streamed.
+    """
+
+    latency: float = 0.0
+    disable_streaming: str = "tool_calling"
+    script: Dict[str, Any] = DEFAULT_SCRIPT
+    answer: str = "This is a scripted answer grounded in the retrieved documents."
+
+    _calls: int = PrivateAttr(default=0)
+    _cycles: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def reset(self):
+        with self._lock:
+            self._calls = 0
+            self._cycles.clear()
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice=None, **kwargs):
+        tools = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(tools=tools, tool_choice=tool_choice, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in _chunks(self._respond(messages, **kwargs)):
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in _chunks(self._respond(messages, **kwargs)):
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _respond(
+        self,
+        messages: List[BaseMessage],
+        tools: Optional[List[dict]] = None,
+        tool_choice=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        with self._lock:
+            self._calls += 1
+
+        tool_calls = []
+        content = ""
+        if tools and tool_choice:
+            # with_structured_output: the schema is the only, forced tool.
+            function = tools[0]["function"]
+            field, spec = next(iter(function["parameters"]["properties"].items()))
+            value = self._next_scripted(function["name"])
+            if spec.get("type") == "array" and not isinstance(value, list):
+                value = [value] * max(1, _count_documents(messages))
+            tool_calls.append(_tool_call(function["name"], {field: value}))
+        elif tools and not isinstance(messages[-1], ToolMessage):
+            function = tools[0]["function"]
+            field = next(iter(function["parameters"]["properties"]), "query")
+            tool_calls.append(
+                _tool_call(function["name"], {field: _text(messages[0])})
+            )
+        else:
+            content = self.answer
+
+        input_tokens = sum(len(_text(message)) for message in messages) // 4 + 1
+        output_tokens = len(content) // 4 + 8
+        message = AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _next_scripted(self, schema_name: str) -> Any:
+        value = self.script.get(schema_name, "yes")
+        if not isinstance(value, list):
+            return value
+        with self._lock:
+            if schema_name not in self._cycles:
+                self._cycles[schema_name] = itertools.cycle(value)
+            return next(self._cycles[schema_name])
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that take `latency` seconds per call."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class FakeSearchTool(BaseTool):
+    """Web search stand-in returning Tavily-shaped results after `latency` seconds."""
+
+    name: str = "tavily_search_results_json"
+    description: str = "A search engine. Input should be a search query."
+    latency: float = 0.0
+    max_results: int = 3
+
+    def _run(
+        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> List[Dict[str, str]]:
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def _arun(
+        self,
+        query: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> List[Dict[str, str]]:
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+    def _results(self, query: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "url": f"https://example.com/{i}",
+                "content": f"Result {i} for {query}: " + "lorem ipsum dolor " * 40,
+            }
+            for i in range(self.max_results)
+        ]
+
+
+def synthetic_corpus(n_chunks: int = 500) -> List[str]:
+    """Chunks of varying topics and roughly the size of real 500-token chunks."""
+    topics = ["agents", "memory", "planning", "prompting", "attacks", "tools"]
+    return [
+        f"Chunk {i} about {topics[i % len(topics)]}. "
+        + f"{topics[i % len(topics)]} detail sentence number {i}. " * 40
+        for i in range(n_chunks)
+    ]
+
+
+def _chunks(result: ChatResult) -> List[ChatGenerationChunk]:
+    # One chunk per word of the answer, the usage on the last one.
+    message = result.generations[0].message
+    words = re.findall(r"\S+\s*", message.content) or [""]
+    return [
+        ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=word,
+                usage_metadata=(
+                    message.usage_metadata if index == len(words) - 1 else None
+                ),
+            )
+        )
+        for index, word in enumerate(words)
+    ]
+
+
+def _tool_call(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    return {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+def _count_documents(messages: List[BaseMessage]) -> int:
+    # Documents formatted by format_documents_for_grading start with "Document i:".
+    return sum(_text(message).count("Document ") for message in messages)
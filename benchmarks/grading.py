@@ -0,0 +1,77 @@
+import time
+
+from dotenv import load_dotenv
+from langchain_community.callbacks import get_openai_callback
+
+from adaptive_rag.components import RagComponents, get_default_components
+from adaptive_rag.models import (
+    get_batch_retrieval_grader,
+    get_model,
+    get_retrieval_grader,
+)
+from adaptive_rag.nodes import grade_documents
+
+QUESTIONS = [
+    "AI Agent에서 메모리 타입을 모두 알려줘.",
+    "Self-reflection의 저자가 누구인지 알려줘",
+    "What are the types of adversarial attacks on LLMs?",
+    "How does chain-of-thought prompting work?",
+]
+GRADING_MODES = ["per_document", "single_call"]
+
+
+def run_grading_benchmark(questions=QUESTIONS, repeats=3):
+    """
+    Compare per-document and single-call relevance grading on live models.
+
+    Both modes grade the same retrieved documents, so the difference in
+    tokens, requests and latency comes from the grading strategy alone. The
+    graders are built without a response cache, so every repeat calls the
+    model.
+
+    Returns:
+        dict: Totals per grading mode
+    """
+    retriever = get_default_components().retriever
+    states = [
+        {"question": question, "documents": retriever.invoke(question)}
+        for question in questions
+    ]
+
+    components = RagComponents(
+        retriever=retriever,
+        retrieval_grader=get_retrieval_grader(get_model()),
+        batch_retrieval_grader=get_batch_retrieval_grader(get_model()),
+    )
+
+    results = {}
+    for mode in GRADING_MODES:
+        config = {"configurable": {"grading_mode": mode, "components": components}}
+        latencies = []
+        with get_openai_callback() as cb:
+            for _ in range(repeats):
+                for state in states:
+                    start = time.perf_counter()
+                    grade_documents(state, config)
+                    latencies.append(time.perf_counter() - start)
+        results[mode] = {
+            "requests": cb.successful_requests,
+            "prompt_tokens": cb.prompt_tokens,
+            "completion_tokens": cb.completion_tokens,
+            "total_cost": cb.total_cost,
+            "mean_latency": sum(latencies) / len(latencies),
+            "max_latency": max(latencies),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    for mode, result in run_grading_benchmark().items():
+        print(
+            f"{mode:>12}: {result['requests']} requests, "
+            f"{result['prompt_tokens']} prompt / {result['completion_tokens']} completion tokens, "
+            f"${result['total_cost']:.4f}, "
+            f"mean {result['mean_latency'] * 1000:.0f} ms, max {result['max_latency'] * 1000:.0f} ms"
+        )
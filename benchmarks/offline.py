@@ -0,0 +1,255 @@
+import asyncio
+import resource
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import create_retriever_tool
+
+from adaptive_rag.components import RagComponents
+from adaptive_rag.graphs import get_adaptive_rag_graph
+from adaptive_rag.main import aget_answer_for, get_answer_for
+from adaptive_rag.models import (
+    get_answer_grader,
+    get_batch_retrieval_grader,
+    get_hallucination_grader,
+    get_question_rewriter,
+    get_question_router,
+    get_rag_chain,
+    get_retrieval_grader,
+    get_retriever,
+    get_vectorstore,
+)
+from adaptive_rag.packing import CharacterEncoding
+from agentic_rag.graphs import get_agentic_rag_graph
+from agentic_rag.utils import clear_registry, register
+from benchmarks.fakes import (
+    FakeSearchTool,
+    ScriptedChatModel,
+    SlowFakeEmbeddings,
+    synthetic_corpus,
+)
+from tutorial.search_graph import SearchChatbotGraph
+
+GRAPHS = ["adaptive", "agentic", "search_chatbot"]
+LOAD_MODES = ["sequential", "threaded", "async"]
+# Same wording as the rlm/rag-prompt hub prompt, kept local to stay offline.
+RAG_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "human",
+            "You are an assistant for question-answering tasks. Use the following "
+            "pieces of retrieved context to answer the question. If you don't know "
+            "the answer, just say that you don't know. Use three sentences maximum "
+            "and keep the answer concise.\n"
+            "Question: {question} \nContext: {context} \nAnswer:",
+        )
+    ]
+)
+QUESTIONS = [
+    "What are the types of memory in LLM agents?",
+    "How does chain of thought prompting work?",
+    "What is a jailbreak attack on a language model?",
+    "How do agents use tools?",
+    "What is task decomposition in planning?",
+]
+
+
+def build_offline_runners(
+    model_latency: float = 0.05,
+    embedding_latency: float = 0.005,
+    search_latency: float = 0.1,
+    script: Optional[Dict[str, Any]] = None,
+    n_chunks: int = 500,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Build every graph on stand-ins for OpenAI, Tavily and the hub.
+
+    Context packing counts tokens with a CharacterEncoding, as tiktoken would
+    download its encoding on first use.
+
+    Args:
+        model_latency (float): Seconds per chat model call
+        embedding_latency (float): Seconds per embedding call
+        search_latency (float): Seconds per web search
+        script (dict): Scripted structured outputs, see benchmarks.fakes
+        n_chunks (int): Size of the synthetic corpus
+
+    Returns:
+        dict: Per graph, the chat model stand-in and sync and async runners
+            taking one question
+    """
+    model_kwargs = {"latency": model_latency}
+    if script is not None:
+        model_kwargs["script"] = script
+
+    embeddings = SlowFakeEmbeddings(size=256, latency=embedding_latency)
+    vectorstore = get_vectorstore(embeddings, "numpy")
+    texts = synthetic_corpus(n_chunks)
+    vectorstore.add_texts(
+        texts,
+        metadatas=[{"source": f"doc-{i // 10}"} for i in range(len(texts))],
+        ids=[str(i) for i in range(len(texts))],
+    )
+    retriever = get_retriever(vectorstore, hybrid=False)
+    search_tool = FakeSearchTool(latency=search_latency)
+
+    adaptive_model = ScriptedChatModel(**model_kwargs)
+    components = RagComponents(
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+        retriever=retriever,
+        rag_chain=get_rag_chain(adaptive_model, RAG_PROMPT),
+        retrieval_grader=get_retrieval_grader(adaptive_model),
+        batch_retrieval_grader=get_batch_retrieval_grader(adaptive_model),
+        question_rewriter=get_question_rewriter(adaptive_model),
+        web_search_tool=search_tool,
+        question_router=get_question_router(adaptive_model),
+        hallucination_grader=get_hallucination_grader(adaptive_model),
+        answer_grader=get_answer_grader(adaptive_model),
+        token_encoding=CharacterEncoding(),
+    )
+    adaptive_graph = get_adaptive_rag_graph(components)
+
+    agentic_model = ScriptedChatModel(**model_kwargs)
+    clear_registry()
+    register("chat_model", agentic_model)
+    register("rag_prompt", RAG_PROMPT)
+    register(
+        "retriever_tools",
+        [
+            create_retriever_tool(
+                retriever, "retrieve_blog_posts", "Search the blog post corpus."
+            )
+        ],
+    )
+    agentic_graph = get_agentic_rag_graph()
+
+    chatbot_model = ScriptedChatModel(**model_kwargs)
+    chatbot_graph = SearchChatbotGraph(chatbot_model, tools=[search_tool]).graph
+
+    def messages(question):
+        return {"messages": [("user", question)]}
+
+    return {
+        "adaptive": {
+            "model": adaptive_model,
+            "run": lambda question: get_answer_for(question, adaptive_graph),
+            "arun": lambda question: aget_answer_for(question, adaptive_graph),
+        },
+        "agentic": {
+            "model": agentic_model,
+            "run": lambda question: agentic_graph.invoke(messages(question)),
+            "arun": lambda question: agentic_graph.ainvoke(messages(question)),
+        },
+        "search_chatbot": {
+            "model": chatbot_model,
+            "run": lambda question: chatbot_graph.invoke(messages(question)),
+            "arun": lambda question: chatbot_graph.ainvoke(messages(question)),
+        },
+    }
+
+
+def run_load(
+    run: Callable,
+    arun: Callable,
+    questions: List[str],
+    mode: str,
+    concurrency: int = 8,
+) -> List[float]:
+    """
+    Answer the questions under one load mode.
+
+    Args:
+        run (callable): Answers one question synchronously
+        arun (callable): Answers one question asynchronously
+        questions (list): The questions
+        mode (str): "sequential", "threaded" or "async"
+        concurrency (int): Worker threads, or questions in flight for "async"
+
+    Returns:
+        list: Latency of each question in seconds
+    """
+
+    def timed(question):
+        start = time.perf_counter()
+        run(question)
+        return time.perf_counter() - start
+
+    if mode == "sequential":
+        return [timed(question) for question in questions]
+    if mode == "threaded":
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(timed, questions))
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def atimed(question):
+            async with semaphore:
+                start = time.perf_counter()
+                await arun(question)
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*[atimed(question) for question in questions])
+
+    return asyncio.run(run_all())
+
+
+def run_offline_benchmark(
+    n_questions: int = 40, concurrency: int = 8, **runner_kwargs
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Benchmark every graph under every load mode without network access.
+
+    Args:
+        n_questions (int): Questions per graph and load mode
+        concurrency (int): Concurrency of the threaded and async modes
+        **runner_kwargs: Latencies and script, see build_offline_runners
+
+    Returns:
+        dict: Per graph and load mode: p50 and p95 latency, requests per
+            second, chat model calls per question and peak RSS in MiB
+    """
+    runners = build_offline_runners(**runner_kwargs)
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(n_questions)]
+
+    results = {}
+    for graph in GRAPHS:
+        runner = runners[graph]
+        results[graph] = {}
+        for mode in LOAD_MODES:
+            runner["model"].reset()
+            start = time.perf_counter()
+            latencies = sorted(
+                run_load(runner["run"], runner["arun"], questions, mode, concurrency)
+            )
+            elapsed = time.perf_counter() - start
+            results[graph][mode] = {
+                "p50_latency": statistics.median(latencies),
+                "p95_latency": latencies[int(0.95 * (len(latencies) - 1))],
+                "requests_per_second": len(questions) / elapsed,
+                "llm_calls_per_question": runner["model"].calls / len(questions),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+    return results
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    for graph, modes in run_offline_benchmark().items():
+        for mode, result in modes.items():
+            print(
+                f"{graph:>14} {mode:>10}: "
+                f"p50 {result['p50_latency'] * 1000:.0f} ms / "
+                f"p95 {result['p95_latency'] * 1000:.0f} ms, "
+                f"{result['requests_per_second']:.1f} req/s, "
+                f"{result['llm_calls_per_question']:.1f} LLM calls/question, "
+                f"peak RSS {result['peak_rss_mb']:.0f} MiB"
+            )
@@ -0,0 +1,99 @@
+import sys
+import time
+
+import numpy as np
+
+from adaptive_rag.vectorstores import (
+    normalize,
+    quantize,
+    quantized_scores,
+    top_k_indices,
+)
+
+CONFIGURATIONS = [
+    ("float16", 0),
+    ("int8", 0),
+    ("int8", 20),
+    ("int8", 50),
+]
+
+
+def synthetic_embeddings(n_vectors=20000, dimension=1536, n_topics=200, seed=0):
+    """Clustered unit vectors, so that nearest neighbours are meaningful."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dimension)).astype(np.float32)
+    assignments = rng.integers(n_topics, size=n_vectors)
+    noise = 0.8 * rng.standard_normal((n_vectors, dimension)).astype(np.float32)
+    return normalize(topics[assignments] + noise)
+
+
+def sample_queries(matrix, n_queries=200, seed=1):
+    """Stored vectors with noise added, standing in for paraphrased questions."""
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.choice(len(matrix), size=n_queries, replace=False)]
+    noise = rng.standard_normal(rows.shape).astype(np.float32)
+    noise *= 0.5 / np.sqrt(rows.shape[1])
+    return normalize(np.asarray(rows, dtype=np.float32) + noise)
+
+
+def evaluate_quantization(matrix, queries, k=4):
+    """
+    Recall@k of quantized search against exact float32 search.
+
+    Args:
+        matrix (np.ndarray): Normalized float32 embeddings, one per row
+        queries (np.ndarray): Normalized float32 queries, one per row
+        k (int): Number of results per query
+
+    Returns:
+        list: One result dict per configuration in CONFIGURATIONS
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    exact = [set(top_k_indices(matrix @ query, k)) for query in queries]
+    full_bytes = matrix.nbytes
+
+    results = []
+    for dtype, rescore_candidates in CONFIGURATIONS:
+        quantized, scales = quantize(matrix, dtype)
+        stored_bytes = quantized.nbytes + (scales.nbytes if scales is not None else 0)
+
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, exact):
+            scores = quantized_scores(quantized, scales, query)
+            top = top_k_indices(scores, max(k, rescore_candidates))
+            if rescore_candidates:
+                top = top[np.argsort(-(matrix[top] @ query))]
+            hits += len(expected & set(top[:k]))
+        elapsed = time.perf_counter() - start
+
+        results.append(
+            {
+                "dtype": dtype,
+                "rescore_candidates": rescore_candidates,
+                "recall": hits / (k * len(queries)),
+                "memory_reduction": full_bytes / stored_bytes,
+                "mean_latency": elapsed / len(queries),
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    # Optionally evaluate on a persisted numpy index instead of synthetic data:
+    #   python -m benchmarks.quantization <index_directory>/embeddings.npy
+    if len(sys.argv) > 1:
+        embeddings = np.load(sys.argv[1], mmap_mode="r")
+    else:
+        embeddings = synthetic_embeddings()
+    k = 4
+
+    print(f"{len(embeddings)} vectors of dimension {embeddings.shape[1]}, k={k}")
+    for result in evaluate_quantization(embeddings, sample_queries(embeddings), k):
+        rescore = result["rescore_candidates"] or "-"
+        print(
+            f"{result['dtype']:>8} rescore {rescore:>3}: "
+            f"recall@{k} {result['recall']:.3f}, "
+            f"{result['memory_reduction']:.1f}x less memory, "
+            f"{result['mean_latency'] * 1000:.2f} ms/query"
+        )
@@ -0,0 +1,104 @@
+import os
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from adaptive_rag.models import get_vectorstore
+from adaptive_rag.vectorstores import NumpyVectorStore
+
+BACKENDS = ["chroma", "numpy"]
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB, or the peak where unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_index(backend, directory, n_chunks, dimension, batch_size=1000):
+    embedding = DeterministicFakeEmbedding(size=dimension)
+    start = time.perf_counter()
+    vectorstore = get_vectorstore(embedding, backend, directory)
+    for offset in range(0, n_chunks, batch_size):
+        end = min(offset + batch_size, n_chunks)
+        vectorstore.add_texts(
+            [f"chunk {i}" for i in range(offset, end)],
+            metadatas=[{"source": f"doc-{i // 10}"} for i in range(offset, end)],
+            ids=[str(i) for i in range(offset, end)],
+        )
+    if isinstance(vectorstore, NumpyVectorStore):
+        vectorstore.persist()
+    return time.perf_counter() - start
+
+
+def load_and_query(backend, directory, dimension, n_queries, k):
+    rss_before = current_rss_mb()
+    embedding = DeterministicFakeEmbedding(size=dimension)
+
+    start = time.perf_counter()
+    vectorstore = get_vectorstore(embedding, backend, directory)
+    load_time = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((n_queries, dimension)).astype(np.float32).tolist()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vectorstore.similarity_search_by_vector(query, k=k)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    return {
+        "load_time": load_time,
+        "p50_latency": statistics.median(latencies),
+        "p95_latency": latencies[int(0.95 * (len(latencies) - 1))],
+        "rss_mb": current_rss_mb() - rss_before,
+    }
+
+
+def run_vectorstore_benchmark(n_chunks=20000, dimension=1536, n_queries=200, k=4):
+    """
+    Compare build time, load time, query latency and memory of the backends.
+
+    Every phase runs in a fresh process, so loading starts from a cold
+    interpreter and RSS is not shared between backends.
+
+    Returns:
+        dict: Results per backend
+    """
+    results = {}
+    for backend in BACKENDS:
+        with tempfile.TemporaryDirectory() as directory:
+            directory = os.path.join(directory, backend)
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                build_time = executor.submit(
+                    build_index, backend, directory, n_chunks, dimension
+                ).result()
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(
+                    load_and_query, backend, directory, dimension, n_queries, k
+                ).result()
+            results[backend] = {"build_time": build_time, **result}
+    return results
+
+
+if __name__ == "__main__":
+    for backend, result in run_vectorstore_benchmark().items():
+        print(
+            f"{backend:>8}: build {result['build_time']:.1f} s, "
+            f"load {result['load_time'] * 1000:.0f} ms, "
+            f"query p50 {result['p50_latency'] * 1000:.2f} ms / "
+            f"p95 {result['p95_latency'] * 1000:.2f} ms, "
+            f"RSS +{result['rss_mb']:.0f} MiB"
+        )
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine to completion from synchronous code.
+
+    Uses a helper thread when the caller is already inside an event loop, e.g.
+    when a lazily built component is first needed by an async graph run.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    result = {}
+
+    def run():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on a file, shared with other processes.
+
+    The lock file is created if missing and kept afterwards. Blocks until the
+    lock is free.
+
+    Args:
+        path (str): Path of the lock file
+    """
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import struct
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+# Record layout of the on-disk cache: sha256 digest, vector length, float32 values.
+_HEADER = struct.Struct("<32sI")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embedding model.
+
+    Vectors are keyed by the SHA-256 of the model name and the text, so chunks
+    shared by different splitter settings, re-ingested documents and repeated
+    queries are embedded once. With a cache path, vectors are appended to a
+    binary file of float32 records and loaded back on the next start.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_path: Optional[str] = None,
+        model: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Dict[bytes, np.ndarray] = {}
+        self._lock = threading.Lock()
+        if cache_path:
+            self._load()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            missing = {
+                key: text for key, text in zip(keys, texts) if key not in self._vectors
+            }
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            self._store(zip(missing, vectors))
+
+        with self._lock:
+            return [self._vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            if key in self._vectors:
+                self.hits += 1
+                return self._vectors[key].tolist()
+            self.misses += 1
+
+        vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return list(vector)
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).digest()
+
+    def _store(self, items):
+        records = []
+        with self._lock:
+            for key, vector in items:
+                vector = np.asarray(vector, dtype=np.float32)
+                self._vectors[key] = vector
+                records.append(_HEADER.pack(key, len(vector)) + vector.tobytes())
+        if self.cache_path and records:
+            # One append per batch keeps concurrent writers from interleaving.
+            with open(self.cache_path, "ab") as f:
+                f.write(b"".join(records))
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            return
+        with open(self.cache_path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            key, dimension = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            end = start + dimension * 4
+            if end > len(data):
+                break
+            self._vectors[key] = np.frombuffer(
+                data, dtype=np.float32, count=dimension, offset=start
+            )
+            offset = end
+
+        if offset < len(data):
+            # Drop the truncated tail of an interrupted write so that new records
+            # are appended on a record boundary.
+            with open(self.cache_path, "r+b") as f:
+                f.truncate(offset)
+
+
+@lru_cache(maxsize=None)
+def get_cached_embeddings() -> CachedEmbeddings:
+    """
+    OpenAI embeddings behind a content-addressed cache, shared by the process.
+
+    adaptive_rag and agentic_rag both embed through it, so text they have in
+    common is embedded once. The cache is persisted to the file named by the
+    EMBEDDING_CACHE_PATH environment variable, or kept in memory when it is
+    not set.
+    """
+    return CachedEmbeddings(
+        OpenAIEmbeddings(), cache_path=os.getenv("EMBEDDING_CACHE_PATH")
+    )
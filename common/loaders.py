@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+from typing_extensions import TypedDict
+
+from common.concurrency import run_sync
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class FetchResult(TypedDict):
+    """
+    A fetched source.
+
+    Attributes:
+        url: source URL
+        status: HTTP status code, 304 when the cached version is still current
+            and 0 when no response was received
+        text: response body, empty for 304 and failed fetches
+        etag: ETag response header
+        last_modified: Last-Modified response header
+        error: why the fetch failed after all retries, None on success
+    """
+
+    url: str
+    status: int
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    error: Optional[str]
+
+
+class AsyncWebFetcher:
+    """
+    Fetches many URLs concurrently over one pooled HTTP session.
+
+    Concurrency is bounded overall and per host, requests to a host can be
+    rate limited, and requests that fail with a connection error, a timeout or
+    one of RETRY_STATUSES are retried with exponential backoff.
+    Results are yielded as they arrive, so a slow host only delays its own
+    sources, and a source that keeps failing is yielded with its error rather
+    than aborting the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_concurrency_per_host: int = 4,
+        requests_per_second_per_host: Optional[float] = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.requests_per_second_per_host = requests_per_second_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._host_next_slot: Dict[str, float] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+
+    async def afetch_all(
+        self, requests: Iterable[Tuple[str, Mapping[str, str]]]
+    ) -> AsyncIterator[FetchResult]:
+        """
+        Fetch every (url, headers) pair, yielding results in completion order.
+
+        Args:
+            requests (iterable): URLs with the request headers to send
+
+        Yields:
+            FetchResult: A fetched source
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency, limit_per_host=self.max_concurrency_per_host
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            tasks = [
+                asyncio.ensure_future(self._fetch(session, url, headers))
+                for url, headers in requests
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def _fetch(
+        self, session: aiohttp.ClientSession, url: str, headers: Mapping[str, str]
+    ) -> FetchResult:
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await self._wait_for_slot(host)
+            try:
+                async with session.get(url, headers=dict(headers)) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                        )
+                    if response.status >= 400:
+                        # Other client and server errors would fail again.
+                        return FetchResult(
+                            url=url,
+                            status=response.status,
+                            text="",
+                            etag=None,
+                            last_modified=None,
+                            error=f"HTTP {response.status} {response.reason}",
+                        )
+                    text = await response.text() if response.status != 304 else ""
+                    return FetchResult(
+                        url=url,
+                        status=response.status,
+                        text=text,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                        error=None,
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    return FetchResult(
+                        url=url,
+                        status=getattr(e, "status", 0),
+                        text="",
+                        etag=None,
+                        last_modified=None,
+                        error=repr(e),
+                    )
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def _wait_for_slot(self, host: str):
+        if not self.requests_per_second_per_host:
+            return
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            now = time.monotonic()
+            slot = max(now, self._host_next_slot.get(host, now))
+            self._host_next_slot[host] = slot + 1 / self.requests_per_second_per_host
+        await asyncio.sleep(slot - now)
+
+
+def html_to_document(url: str, html: str) -> Document:
+    """
+    Extract the text and metadata of a page the way WebBaseLoader does.
+
+    Args:
+        url (str): URL of the page
+        html (str): HTML of the page
+
+    Returns:
+        Document: The page text with source, title, description and language
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+async def asplit_web_documents(
+    urls: List[str],
+    text_splitter: TextSplitter,
+    fetcher: Optional[AsyncWebFetcher] = None,
+) -> AsyncIterator[List[Document]]:
+    """
+    Fetch pages concurrently and split each one as soon as it arrives.
+
+    Args:
+        urls (list): URLs of the pages
+        text_splitter (TextSplitter): Splitter for the page text
+        fetcher (AsyncWebFetcher): Fetcher to use, a default one if not given
+
+    Yields:
+        list: The chunks of one page; pages that failed to load are skipped
+    """
+    fetcher = fetcher or AsyncWebFetcher()
+    async for fetched in fetcher.afetch_all((url, {}) for url in urls):
+        if fetched["error"] is not None:
+            logger.warning("Skipping %s: %s", fetched["url"], fetched["error"])
+            continue
+        document = html_to_document(fetched["url"], fetched["text"])
+        yield text_splitter.split_documents([document])
+
+
+def load_split_web_documents(
+    urls: List[str],
+    text_splitter: TextSplitter,
+    fetcher: Optional[AsyncWebFetcher] = None,
+) -> List[Document]:
+    """Synchronous wrapper collecting the chunks of asplit_web_documents."""
+
+    async def collect():
+        return [
+            chunk
+            async for chunks in asplit_web_documents(urls, text_splitter, fetcher)
+            for chunk in chunks
+        ]
+
+    return run_sync(collect())
+
@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from langchain import hub
+from langchain_core.load import dumps, loads
+from langchain_core.prompts import BasePromptTemplate
+
+RAG_PROMPT_NAME = "rlm/rag-prompt"
+# Version of a prompt pulled without a commit whose hash the hub did not report.
+UNVERSIONED = "latest"
+LATEST_FILENAME = "LATEST"
+
+
+class PromptRegistry:
+    """
+    Prompts from the LangChain hub, pulled once and then served from memory.
+
+    With a cache directory every pulled or seeded prompt is also stored as
+    <directory>/<owner>/<repo>/<version>.json, with a LATEST file naming the
+    version to use when none is asked for. A later process, or one without
+    network access, loads prompts from there instead of pulling them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        puller: Optional[Callable[[str], BasePromptTemplate]] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.puller = puller
+        self.pulls = 0
+        self._prompts: Dict[Tuple[str, str], BasePromptTemplate] = {}
+        self._latest: Dict[str, str] = {}
+        # Re-entrant: get holds it while loading or pulling a missing prompt,
+        # so that concurrent first requests pull once.
+        self._lock = threading.RLock()
+
+    def get(self, name: str, refresh: bool = False) -> BasePromptTemplate:
+        """
+        A parsed prompt, from memory, the cache directory or the hub.
+
+        Args:
+            name (str): "owner/repo", or "owner/repo:commit" for a fixed version
+            refresh (bool): Pull the latest version even if one is cached
+
+        Returns:
+            BasePromptTemplate: The prompt, shared by all callers
+        """
+        repo, pinned = _split_version(name)
+        with self._lock:
+            version = pinned
+            if version is None and not refresh:
+                version = self._latest.get(repo) or self._read_latest(repo)
+            if version is not None and not (refresh and pinned is None):
+                prompt = self._prompts.get((repo, version)) or self._read(repo, version)
+                if prompt is not None:
+                    self._remember(repo, version, prompt, latest=pinned is None)
+                    return prompt
+
+            prompt = (self.puller or hub.pull)(name)
+            self.pulls += 1
+            self._store(repo, pinned or _commit_of(prompt), prompt, pinned is None)
+            return prompt
+
+    def seed(self, name: str, prompt: BasePromptTemplate, version: str = UNVERSIONED):
+        """
+        Register a prompt without pulling it, e.g. for offline use.
+
+        Args:
+            name (str): "owner/repo" the prompt is requested under
+            prompt (BasePromptTemplate): The prompt
+            version (str): Version to store it as, which becomes the latest
+        """
+        repo, _ = _split_version(name)
+        with self._lock:
+            self._store(repo, version, prompt, latest=True)
+
+    def _store(self, repo: str, version: str, prompt: BasePromptTemplate, latest: bool):
+        self._remember(repo, version, prompt, latest)
+        if self.cache_dir:
+            self._write(repo, version, prompt, latest)
+
+    def _remember(
+        self, repo: str, version: str, prompt: BasePromptTemplate, latest: bool
+    ):
+        self._prompts[(repo, version)] = prompt
+        if latest:
+            self._latest[repo] = version
+
+    def _path(self, repo: str, filename: str) -> str:
+        return os.path.join(self.cache_dir, *repo.split("/"), filename)
+
+    def _read_latest(self, repo: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(repo, LATEST_FILENAME)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _read(self, repo: str, version: str) -> Optional[BasePromptTemplate]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(repo, f"{version}.json"), encoding="utf-8") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _write(
+        self, repo: str, version: str, prompt: BasePromptTemplate, latest: bool
+    ):
+        path = self._path(repo, f"{version}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        files = [(path, dumps(prompt, pretty=True))]
+        if latest:
+            files.append((self._path(repo, LATEST_FILENAME), version))
+        for target, content in files:
+            temporary = f"{target}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temporary, target)
+
+
+def _split_version(name: str) -> Tuple[str, Optional[str]]:
+    repo, _, version = name.partition(":")
+    return repo, version or None
+
+
+def _commit_of(prompt: BasePromptTemplate) -> str:
+    metadata = getattr(prompt, "metadata", None) or {}
+    return metadata.get("lc_hub_commit_hash") or UNVERSIONED
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """
+    The process-wide prompt registry.
+
+    Its cache directory is set by the PROMPT_REGISTRY_DIR environment
+    variable; without it prompts are only kept in memory.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(os.getenv("PROMPT_REGISTRY_DIR"))
+        return _registry
+
+
+def get_prompt(name: str) -> BasePromptTemplate:
+    """A prompt from the process-wide registry, pulled on first use only."""
+    return get_prompt_registry().get(name)
+
+
+if __name__ == "__main__":
+    # Pre-seed the cache directory, e.g. when building an offline image:
+    #   PROMPT_REGISTRY_DIR=prompts python -m common.prompts rlm/rag-prompt
+    registry = get_prompt_registry()
+    if not registry.cache_dir:
+        sys.exit("Set PROMPT_REGISTRY_DIR to the directory to store prompts in.")
+    for name in sys.argv[1:] or [RAG_PROMPT_NAME]:
+        prompt = registry.get(name, refresh=True)
+        print(json.dumps({"prompt": name, "version": _commit_of(prompt)}))
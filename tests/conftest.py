@@ -0,0 +1,50 @@
+import pytest
+
+from adaptive_rag.components import RagComponents
+from adaptive_rag.models import (
+    get_answer_grader,
+    get_batch_retrieval_grader,
+    get_hallucination_grader,
+    get_question_rewriter,
+    get_question_router,
+    get_rag_chain,
+    get_retrieval_grader,
+    get_retriever,
+    get_vectorstore,
+)
+from adaptive_rag.packing import CharacterEncoding
+from benchmarks.fakes import FakeSearchTool, SlowFakeEmbeddings, synthetic_corpus
+from benchmarks.offline import RAG_PROMPT
+
+
+@pytest.fixture
+def make_components():
+    """
+    Build adaptive RAG components on the benchmark stand-ins.
+
+    Every chain runs on the given ScriptedChatModel; the retriever searches a
+    small synthetic corpus. Keyword arguments replace single components.
+    """
+
+    def make(model, **overrides) -> RagComponents:
+        embeddings = SlowFakeEmbeddings(size=64)
+        vectorstore = get_vectorstore(embeddings, "numpy")
+        vectorstore.add_texts(synthetic_corpus(50))
+        components = {
+            "embeddings": embeddings,
+            "vectorstore": vectorstore,
+            "retriever": get_retriever(vectorstore, hybrid=False),
+            "rag_chain": get_rag_chain(model, RAG_PROMPT),
+            "retrieval_grader": get_retrieval_grader(model),
+            "batch_retrieval_grader": get_batch_retrieval_grader(model),
+            "question_rewriter": get_question_rewriter(model),
+            "web_search_tool": FakeSearchTool(),
+            "question_router": get_question_router(model),
+            "hallucination_grader": get_hallucination_grader(model),
+            "answer_grader": get_answer_grader(model),
+            "token_encoding": CharacterEncoding(),
+        }
+        components.update(overrides)
+        return RagComponents(**components)
+
+    return make
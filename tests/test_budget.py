@@ -0,0 +1,80 @@
+import logging
+
+from adaptive_rag.budget import RunBudget
+from adaptive_rag.graphs import get_adaptive_rag_graph
+from adaptive_rag.main import get_answer_for, get_answers_for
+from benchmarks.fakes import DEFAULT_SCRIPT, ScriptedChatModel
+
+# Every generation is judged unsupported, so the graph would loop forever.
+UNSUPPORTED = {**DEFAULT_SCRIPT, "GradeHallucinations": "no"}
+
+
+def make_graph(make_components, model):
+    return get_adaptive_rag_graph(make_components(model))
+
+
+def test_exhausted_budget_ends_the_run_with_the_latest_generation(
+    make_components, caplog
+):
+    model = ScriptedChatModel(script=UNSUPPORTED)
+    graph = make_graph(make_components, model)
+    budget = RunBudget(max_llm_calls=8)
+
+    with caplog.at_level(logging.INFO, logger="adaptive_rag.main"):
+        answer = get_answer_for("What is an agent?", graph, budget=budget)
+
+    assert answer == model.answer
+    report = budget.report()
+    assert report["exhausted_by"] == "llm_calls"
+    # Usage can overshoot the limit by the step in progress only.
+    assert 8 <= report["llm_calls"] <= 10
+    assert report["tokens"] > 0
+    assert "exhausted_by': 'llm_calls'" in caplog.text
+
+
+def test_token_limit_is_enforced(make_components):
+    model = ScriptedChatModel(script=UNSUPPORTED)
+    graph = make_graph(make_components, model)
+    budget = RunBudget(max_tokens=500)
+
+    get_answer_for("What is an agent?", graph, budget=budget)
+
+    assert budget.report()["exhausted_by"] == "tokens"
+
+
+def test_reused_budget_starts_each_run_afresh(make_components):
+    model = ScriptedChatModel(script=UNSUPPORTED)
+    graph = make_graph(make_components, model)
+    budget = RunBudget(max_llm_calls=8)
+
+    get_answer_for("What is an agent?", graph, budget=budget)
+    calls_before = model.calls
+    answer = get_answer_for("What is a prompt?", graph, budget=budget)
+
+    assert answer == model.answer
+    assert model.calls - calls_before == budget.report()["llm_calls"] >= 8
+
+
+def test_run_within_budget_is_not_exhausted(make_components):
+    graph = make_graph(make_components, ScriptedChatModel())
+    budget = RunBudget(max_llm_calls=50, max_tokens=100_000, max_seconds=60)
+
+    get_answer_for("What is an agent?", graph, budget=budget)
+
+    assert budget.report()["exhausted_by"] is None
+
+
+def test_batch_answers_get_a_budget_each(make_components):
+    model = ScriptedChatModel(script=UNSUPPORTED)
+    graph = make_graph(make_components, model)
+    budgets = []
+
+    def budget_factory():
+        budgets.append(RunBudget(max_llm_calls=8))
+        return budgets[-1]
+
+    answers = get_answers_for(["a?", "b?", "c?"], graph, budget_factory=budget_factory)
+
+    assert answers == [model.answer] * 3
+    assert len(budgets) == 3
+    assert all(budget.report()["exhausted_by"] == "llm_calls" for budget in budgets)
@@ -0,0 +1,85 @@
+import time
+
+from langchain_core.documents import Document
+from langchain_core.outputs import Generation
+
+from adaptive_rag.caches import ResponseCache, SemanticCache, SQLiteSemanticStore
+from benchmarks.fakes import SlowFakeEmbeddings
+
+LLM_STRING = "model=scripted"
+
+
+def test_response_cache_round_trips_through_disk(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    ResponseCache("writer", sqlite_path=path).update(
+        "prompt", LLM_STRING, [Generation(text="answer")]
+    )
+
+    reader = ResponseCache("reader", sqlite_path=path)
+    cached = reader.lookup("prompt", LLM_STRING)
+
+    assert [generation.text for generation in cached] == ["answer"]
+    assert reader.stats()["disk_hits"] == 1
+    assert reader.lookup("other prompt", LLM_STRING) is None
+
+
+def test_response_cache_clear_drops_disk_entries(tmp_path):
+    cache = ResponseCache("grader", sqlite_path=str(tmp_path / "responses.sqlite"))
+    cache.update("prompt", LLM_STRING, [Generation(text="answer")])
+
+    cache.clear()
+
+    assert cache.lookup("prompt", LLM_STRING) is None
+
+
+def make_semantic_cache(**kwargs):
+    return SemanticCache(SlowFakeEmbeddings(size=64), **kwargs)
+
+
+def test_semantic_cache_hits_the_same_question_only():
+    cache = make_semantic_cache()
+    cache.add("What is an agent?", "An agent plans and acts.", [])
+
+    entry = cache.lookup("What is an agent?")
+
+    assert entry["generation"] == "An agent plans and acts."
+    assert cache.lookup("Who won the match?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_cache_evicts_the_least_recently_used_entry():
+    cache = make_semantic_cache(max_size=2)
+    cache.add("first", "1", [])
+    cache.add("second", "2", [])
+    cache.lookup("first")
+
+    cache.add("third", "3", [])
+
+    assert cache.lookup("second") is None
+    assert cache.lookup("first")["generation"] == "1"
+    assert cache.lookup("third")["generation"] == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_semantic_cache_expires_entries_after_the_ttl():
+    cache = make_semantic_cache(ttl=0.05)
+    cache.add("question", "answer", [])
+    time.sleep(0.1)
+
+    assert cache.lookup("question") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_semantic_cache_reloads_entries_from_sqlite(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    document = Document(page_content="chunk", metadata={"source": "a"})
+    make_semantic_cache(store=SQLiteSemanticStore(path)).add(
+        "question", "answer", [document]
+    )
+
+    entry = make_semantic_cache(store=SQLiteSemanticStore(path)).lookup("question")
+
+    assert entry["generation"] == "answer"
+    assert entry["documents"] == [document]
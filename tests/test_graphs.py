@@ -0,0 +1,12 @@
+from langgraph.graph.state import CompiledStateGraph
+
+from adaptive_rag.components import RagComponents
+from adaptive_rag.graphs import get_adaptive_rag_graph
+
+
+def test_settings_keep_the_compiled_graph():
+    graph = get_adaptive_rag_graph(RagComponents(), grading_mode="single_call")
+
+    assert isinstance(graph, CompiledStateGraph)
+    assert graph.config["configurable"]["grading_mode"] == "single_call"
+    assert "generate" in graph.get_graph().nodes
@@ -0,0 +1,107 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase
+
+from common.loaders import AsyncWebFetcher
+
+
+class AsyncWebFetcherTest(AioHTTPTestCase):
+    async def get_application(self):
+        self.calls = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def flaky(request):
+            self.calls["flaky"] = self.calls.get("flaky", 0) + 1
+            if self.calls["flaky"] < 3:
+                return web.Response(status=503)
+            return web.Response(text="recovered")
+
+        async def broken(request):
+            return web.Response(status=500)
+
+        async def missing(request):
+            self.calls["missing"] = self.calls.get("missing", 0) + 1
+            return web.Response(status=404)
+
+        async def versioned(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304)
+            return web.Response(
+                text="<html><body>v1</body></html>", headers={"ETag": '"v1"'}
+            )
+
+        async def slow(request):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            return web.Response(text=request.match_info["page"])
+
+        app = web.Application()
+        app.router.add_get("/flaky", flaky)
+        app.router.add_get("/broken", broken)
+        app.router.add_get("/missing", missing)
+        app.router.add_get("/versioned", versioned)
+        app.router.add_get("/slow/{page}", slow)
+        return app
+
+    async def fetch_all(self, fetcher, requests):
+        return {
+            result["url"]: result async for result in fetcher.afetch_all(requests)
+        }
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+    async def test_retries_failed_requests(self):
+        fetcher = AsyncWebFetcher(retries=3, backoff=0)
+        results = await self.fetch_all(fetcher, [(self.url("/flaky"), {})])
+
+        result = results[self.url("/flaky")]
+        self.assertEqual(result["status"], 200)
+        self.assertEqual(result["text"], "recovered")
+        self.assertIsNone(result["error"])
+        self.assertEqual(self.calls["flaky"], 3)
+
+    async def test_failed_source_does_not_abort_the_others(self):
+        fetcher = AsyncWebFetcher(retries=1, backoff=0)
+        results = await self.fetch_all(
+            fetcher, [(self.url("/broken"), {}), (self.url("/versioned"), {})]
+        )
+
+        broken = results[self.url("/broken")]
+        self.assertEqual(broken["status"], 500)
+        self.assertIsNotNone(broken["error"])
+        self.assertEqual(results[self.url("/versioned")]["status"], 200)
+
+    async def test_client_errors_are_not_retried(self):
+        fetcher = AsyncWebFetcher(retries=3, backoff=10)
+        results = await self.fetch_all(fetcher, [(self.url("/missing"), {})])
+
+        missing = results[self.url("/missing")]
+        self.assertEqual(missing["status"], 404)
+        self.assertIsNotNone(missing["error"])
+        self.assertEqual(self.calls["missing"], 1)
+
+    async def test_conditional_headers(self):
+        fetcher = AsyncWebFetcher()
+        url = self.url("/versioned")
+        first = (await self.fetch_all(fetcher, [(url, {})]))[url]
+        second = (
+            await self.fetch_all(fetcher, [(url, {"If-None-Match": first["etag"]})])
+        )[url]
+
+        self.assertEqual(first["status"], 200)
+        self.assertEqual(first["etag"], '"v1"')
+        self.assertEqual(second["status"], 304)
+        self.assertEqual(second["text"], "")
+
+    async def test_per_host_concurrency_limit(self):
+        fetcher = AsyncWebFetcher(max_concurrency=16, max_concurrency_per_host=2)
+        requests = [(self.url(f"/slow/{page}"), {}) for page in range(6)]
+        results = await self.fetch_all(fetcher, requests)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(self.max_in_flight, 2)
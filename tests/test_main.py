@@ -0,0 +1,59 @@
+from adaptive_rag.caches import SemanticCache
+from adaptive_rag.graphs import get_adaptive_rag_graph
+from adaptive_rag.main import stream_answer_for
+from benchmarks.fakes import DEFAULT_SCRIPT, ScriptedChatModel, SlowFakeEmbeddings
+
+
+def events_of(make_components, script, **kwargs):
+    model = ScriptedChatModel(script={**DEFAULT_SCRIPT, **script})
+    graph = get_adaptive_rag_graph(make_components(model))
+    return model, list(stream_answer_for("What is an agent?", graph, **kwargs))
+
+
+def shown(events):
+    # The streamed text between retracts, and the event types in between.
+    texts, types = [""], []
+    for event in events:
+        if event["type"] == "token":
+            texts[-1] += event["content"]
+        elif event["type"] == "retract":
+            texts.append("")
+        if not types or types[-1] != event["type"]:
+            types.append(event["type"])
+    return texts, types
+
+
+def test_accepted_answer_streams_without_retraction(make_components):
+    model, events = events_of(make_components, {})
+
+    assert shown(events) == ([model.answer], ["token", "final"])
+    assert events[-1]["content"] == model.answer
+    assert events[-1]["time_to_first_token"] <= events[-1]["total_latency"]
+
+
+def test_unsupported_generation_is_retracted(make_components):
+    # The first generation is judged unsupported and generated again.
+    model, events = events_of(make_components, {"GradeHallucinations": ["no", "yes"]})
+
+    texts, types = shown(events)
+    assert texts == [model.answer, model.answer]
+    assert types == ["token", "retract", "token", "final"]
+    assert events[-1]["content"] == model.answer
+
+
+def test_cached_answer_is_streamed_at_once(make_components):
+    cache = SemanticCache(SlowFakeEmbeddings(size=64))
+    cache.add("What is an agent?", "A cached answer.", [])
+
+    _, events = events_of(make_components, {}, cache=cache)
+
+    assert shown(events) == (["A cached answer."], ["token", "final"])
+
+
+def test_answer_that_misses_the_question_is_retracted(make_components):
+    # The first answer is judged not useful, so the question is rewritten.
+    model, events = events_of(make_components, {"GradeAnswer": ["no", "yes"]})
+
+    texts, types = shown(events)
+    assert texts == [model.answer, model.answer]
+    assert types == ["token", "retract", "token", "final"]
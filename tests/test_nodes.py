@@ -0,0 +1,62 @@
+import time
+
+from langchain_core.documents import Document
+
+from adaptive_rag.nodes import grade_documents
+from benchmarks.fakes import ScriptedChatModel
+
+DOCUMENTS = [Document(page_content=f"chunk {i}") for i in range(3)]
+
+
+def test_score_thresholds_decide_clear_cut_documents_without_the_llm(
+    make_components,
+):
+    model = ScriptedChatModel(script={"GradeDocuments": "no"})
+    config = {
+        "configurable": {
+            "components": make_components(model),
+            "grading_score_thresholds": (0.3, 0.8),
+        }
+    }
+    state = {"question": "q", "documents": DOCUMENTS, "scores": [0.9, 0.1, 0.5]}
+
+    result = grade_documents(state, config)
+
+    # Only the document in the uncertain band is graded, and the LLM rejects it.
+    assert result["documents"] == DOCUMENTS[:1]
+    assert result["scores"] == [0.9]
+    assert model.calls == 1
+
+
+def test_documents_without_scores_are_all_graded(make_components):
+    model = ScriptedChatModel()
+    config = {
+        "configurable": {
+            "components": make_components(model),
+            "grading_score_thresholds": (0.3, 0.8),
+        }
+    }
+    state = {"question": "q", "documents": DOCUMENTS, "scores": None}
+
+    result = grade_documents(state, config)
+
+    assert result["documents"] == DOCUMENTS
+    assert model.calls == 3
+
+
+def test_documents_are_graded_concurrently(make_components):
+    model = ScriptedChatModel(latency=0.2)
+    components = make_components(model)
+    documents = DOCUMENTS + [Document(page_content="chunk 3")]
+    state = {"question": "q", "documents": documents}
+
+    start = time.perf_counter()
+    result = grade_documents(
+        state,
+        {"configurable": {"components": components, "grading_max_concurrency": 4}},
+    )
+    elapsed = time.perf_counter() - start
+
+    assert result["documents"] == documents
+    assert model.calls == 4
+    assert elapsed < 0.6
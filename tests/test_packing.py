@@ -0,0 +1,67 @@
+from unittest import mock
+
+from langchain_core.documents import Document
+
+from adaptive_rag.packing import CharacterEncoding, get_encoding, pack_documents
+
+ENCODING = CharacterEncoding()
+
+
+def document(text, tokens=100):
+    # CharacterEncoding counts four characters per token.
+    return Document(page_content=(text + " ") * (4 * tokens // (len(text) + 1)))
+
+
+def pack(documents, **kwargs):
+    return pack_documents(documents, encoding=ENCODING, **kwargs)
+
+
+def test_near_duplicates_are_dropped():
+    original = Document(page_content=" ".join(f"step{i}" for i in range(100)))
+    duplicate = Document(page_content=original.page_content + " extra")
+    other = document("prompts steer what the model says")
+
+    packed, stats = pack([original, duplicate, other])
+
+    assert packed == [original, other]
+    assert stats["duplicates_removed"] == 1
+
+
+def test_documents_are_packed_by_score_then_retrieval_order():
+    first, second, third = (document(f"topic number {i} text") for i in range(3))
+
+    packed, _ = pack([first, second, third], scores=[0.2, None, 0.9])
+
+    assert packed == [third, first, second]
+
+
+def test_the_document_crossing_the_budget_is_trimmed():
+    first = document("memory types of agents")
+    second = document("tool use by agents")
+
+    packed, stats = pack([first, second], token_budget=160)
+
+    remaining = 160 - len(ENCODING.encode(first.page_content))
+    assert packed[0] == first
+    assert len(ENCODING.encode(packed[1].page_content)) == remaining
+    assert stats["packed_tokens"] == 160
+    assert stats["tokens_saved"] == stats["input_tokens"] - 160
+
+
+def test_short_trimmed_tails_are_dropped():
+    first = document("memory types of agents")
+    second = document("tool use by agents")
+
+    packed, stats = pack([first, second], token_budget=120)
+
+    assert packed == [first]
+    assert stats["documents_out"] == 1
+
+
+def test_encoding_falls_back_to_an_estimate_when_the_download_fails():
+    get_encoding.cache_clear()
+    try:
+        with mock.patch("tiktoken.encoding_for_model", side_effect=OSError("x")):
+            assert isinstance(get_encoding("some-model"), CharacterEncoding)
+    finally:
+        get_encoding.cache_clear()
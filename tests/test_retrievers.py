@@ -0,0 +1,94 @@
+from langchain_core.documents import Document
+
+from adaptive_rag.retrievers import (
+    RELEVANCE_SCORE_KEY,
+    BM25Index,
+    HybridRetriever,
+    VectorRetriever,
+    relevance_scores,
+    tokenize,
+)
+from adaptive_rag.vectorstores import NumpyVectorStore
+from benchmarks.fakes import SlowFakeEmbeddings, synthetic_corpus
+
+TEXTS = synthetic_corpus(50)
+RARE = "The ZX81 handshake uses a nonce."
+
+
+def make_store(texts):
+    store = NumpyVectorStore(SlowFakeEmbeddings(size=64))
+    store.add_texts(texts, metadatas=[{"source": "corpus"} for _ in texts])
+    return store
+
+
+def test_tokenize_splits_scripts():
+    assert tokenize("Self-reflection의 저자") == ["self", "reflection", "의", "저자"]
+
+
+def test_bm25_ranks_rare_terms_first():
+    documents = [Document(page_content=text) for text in TEXTS + [RARE]]
+    index = BM25Index.from_documents(documents)
+
+    (best, score), *_ = index.search("zx81 handshake")
+
+    assert best.page_content == RARE
+    assert score > 0
+    assert index.search("no such term") == []
+
+
+def test_bm25_skips_duplicate_documents():
+    document = Document(page_content=RARE, metadata={"source": "a"})
+    index = BM25Index.from_documents([document, document])
+
+    assert len(index) == 1
+
+
+def test_hybrid_search_surfaces_keyword_only_matches():
+    store = make_store(TEXTS + [RARE])
+    bm25 = BM25Index.from_documents(store.documents())
+    retriever = HybridRetriever(vectorstore=store, bm25=bm25, fetch_k=5)
+
+    documents = retriever.invoke("ZX81")
+
+    assert len(documents) == 4
+    assert RARE in [document.page_content for document in documents]
+
+
+def test_hybrid_search_ranks_documents_found_by_both_first():
+    store = make_store(TEXTS)
+    bm25 = BM25Index.from_documents(store.documents())
+    retriever = HybridRetriever(vectorstore=store, bm25=bm25)
+
+    best, score = retriever.search_with_scores(TEXTS[10])[0]
+
+    assert best.page_content == TEXTS[10]
+    assert score > 0.99
+
+
+def test_keyword_only_matches_carry_no_relevance_score():
+    store = make_store(TEXTS)
+    bm25 = BM25Index.from_documents(
+        store.documents() + [Document(page_content=RARE, metadata={"source": "web"})]
+    )
+    retriever = HybridRetriever(vectorstore=store, bm25=bm25)
+
+    scores = {
+        document.page_content: document.metadata.get(RELEVANCE_SCORE_KEY)
+        for document in retriever.invoke("ZX81 handshake")
+    }
+
+    assert scores[RARE] is None
+    assert all(score is not None for text, score in scores.items() if text != RARE)
+
+
+def test_vector_retriever_scores_copies_of_the_stored_documents():
+    store = make_store(TEXTS)
+    retriever = VectorRetriever(vectorstore=store, k=3)
+
+    documents = retriever.invoke(TEXTS[5])
+
+    assert relevance_scores(documents)[0] > 0.99
+    assert relevance_scores(documents) == sorted(
+        relevance_scores(documents), reverse=True
+    )
+    assert all(RELEVANCE_SCORE_KEY not in d.metadata for d in store.documents())
@@ -0,0 +1,39 @@
+from adaptive_rag.routers import SimilarityPreRouter
+from adaptive_rag.vectorstores import NumpyVectorStore
+from benchmarks.fakes import SlowFakeEmbeddings
+
+CORPUS = ["agents plan with memory", "prompts guide the model"]
+
+
+def make_router():
+    vectorstore = NumpyVectorStore(SlowFakeEmbeddings(size=64), dtype="int8")
+    vectorstore.add_texts(CORPUS)
+    return SimilarityPreRouter(vectorstore)
+
+
+def test_relevance_scores_stay_within_bounds():
+    router = make_router()
+
+    for text in CORPUS + ["something else entirely"]:
+        assert 0.0 <= router.top_similarity(text) <= 1.0
+
+
+def test_calibrated_thresholds_route_known_questions_correctly():
+    router = make_router()
+    questions = {"vectorstore": CORPUS, "web_search": ["who won the match today"]}
+    thresholds = router.calibrate(questions)
+
+    def fail(question):
+        raise AssertionError(f"{question!r} was not routed locally")
+
+    for datasource, examples in questions.items():
+        for question in examples:
+            assert router.route(question, fail, thresholds) == datasource
+    assert router.stats() == {"local:vectorstore": 2, "local:web_search": 1}
+
+
+def test_inconclusive_questions_fall_back_to_the_llm_router():
+    router = make_router()
+
+    assert router.route(CORPUS[0], lambda q: "web_search", (0.0, 2.0)) == "web_search"
+    assert router.stats() == {"llm:web_search": 1}
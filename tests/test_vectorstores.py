@@ -0,0 +1,70 @@
+import pytest
+
+from adaptive_rag.vectorstores import NumpyVectorStore
+from benchmarks.fakes import SlowFakeEmbeddings, synthetic_corpus
+
+EMBEDDINGS = SlowFakeEmbeddings(size=64)
+TEXTS = synthetic_corpus(50)
+
+
+def make_store(texts=TEXTS, **kwargs):
+    store = NumpyVectorStore(EMBEDDINGS, **kwargs)
+    store.add_texts(texts, ids=[str(i) for i in range(len(texts))])
+    return store
+
+
+def top_texts(store, query, k=5):
+    return [document.page_content for document in store.similarity_search(query, k=k)]
+
+
+def test_adds_and_deletes_reach_disk_only_on_persist(tmp_path):
+    directory = str(tmp_path / "index")
+    store = make_store(persist_directory=directory)
+    assert len(NumpyVectorStore(EMBEDDINGS, persist_directory=directory)) == 0
+
+    store.persist()
+    store.delete(ids=["0"])
+    reloaded = NumpyVectorStore(EMBEDDINGS, persist_directory=directory)
+    assert len(reloaded) == len(TEXTS)
+
+    store.persist()
+    reloaded = NumpyVectorStore(EMBEDDINGS, persist_directory=directory)
+    assert len(reloaded) == len(TEXTS) - 1
+    assert reloaded.get_by_ids(["0"]) == []
+    assert top_texts(reloaded, TEXTS[7]) == top_texts(store, TEXTS[7])
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_search_finds_the_exact_match(dtype):
+    store = make_store(dtype=dtype)
+
+    for index in [0, 13, 42]:
+        document, score = store.similarity_search_with_score(TEXTS[index], k=1)[0]
+        assert document.page_content == TEXTS[index]
+        assert score == pytest.approx(1.0, abs=0.02)
+
+
+def test_rescoring_restores_full_precision_order():
+    exact = make_store()
+    rescored = make_store(dtype="int8", rescore_candidates=20)
+
+    for query in TEXTS[:5]:
+        assert top_texts(rescored, query) == top_texts(exact, query)
+
+
+def test_quantized_store_reloads_from_disk(tmp_path):
+    directory = str(tmp_path / "index")
+    make_store(persist_directory=directory, dtype="int8").persist()
+
+    reloaded = NumpyVectorStore(EMBEDDINGS, persist_directory=directory, dtype="int8")
+
+    assert len(reloaded) == len(TEXTS)
+    assert top_texts(reloaded, TEXTS[3], k=1) == [TEXTS[3]]
+
+
+def test_relevance_scores_are_clipped_to_one():
+    store = make_store(dtype="int8")
+
+    _, relevance = store.similarity_search_with_relevance_scores(TEXTS[0], k=1)[0]
+
+    assert 0.0 <= relevance <= 1.0
@@ -1,4 +1,5 @@
 import json
+from typing import Optional
 
 from langchain_community.tools import TavilySearchResults
 from langchain_core.messages import ToolMessage
@@ -59,16 +60,18 @@ def route_tools(state: State):
 
 
 class SearchChatbotGraph(ChatbotGraphInterface):
-    def __init__(self, llm: ChatOpenAI):
-        llm_with_tools = llm.bind_tools(get_tavily_search_tools())
-        self.graph = SearchChatbotGraph._build_graph(llm_with_tools)
+    def __init__(self, llm: ChatOpenAI, tools: Optional[list] = None):
+        if tools is None:
+            tools = get_tavily_search_tools()
+        llm_with_tools = llm.bind_tools(tools)
+        self.graph = SearchChatbotGraph._build_graph(llm_with_tools, tools)
 
     @staticmethod
-    def _build_graph(llm) -> CompiledStateGraph:
+    def _build_graph(llm, tools: list) -> CompiledStateGraph:
         def chatbot(state: State):
             return {"messages": [llm.invoke(state["messages"])]}
 
-        tool_node = BasicToolNode(tools=get_tavily_search_tools())
+        tool_node = BasicToolNode(tools=tools)
 
         graph_builder = StateGraph(State)
         graph_builder.add_node("chatbot", chatbot)